@@ -0,0 +1,142 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+
+from .config import settings
+from .models import Dispatch, GameState, Hospital, Incident, Personnel, Station, TableVersion, Unit, state_columns
+from .repo import begin_read, current_tenant, get_read_session
+
+try:
+    import msgpack
+except ImportError:  # optional: clients then get JSON only
+    msgpack = None
+
+# Sections of the world state, keyed by table name as in the event log.
+API_TABLES = (
+    ("gamestate", GameState),
+    ("station", Station),
+    ("hospital", Hospital),
+    ("unit", Unit),
+    ("personnel", Personnel),
+    ("incident", Incident),
+    ("dispatch", Dispatch),
+)
+# Below this a gzip header costs more than it saves.
+GZIP_MIN_BYTES = 1024
+COLUMNS = {name: state_columns(model.__table__) for name, model in API_TABLES}
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _table_versions(s) -> Dict[str, int]:
+    # Every commit raises at least one shared table counter, so their sum orders all
+    # commits and is the same in every process.
+    return dict(s.execute(select(TableVersion.name, TableVersion.version)).all())
+
+
+class StateHistory:
+    # The last few API snapshots of one world, each labelled with the world version it
+    # was read at, so a client that sends one of those labels gets only what changed.
+    # Tables whose shared version has not moved since the previous snapshot are shared
+    # with it rather than read again, and so are rows equal to the previous ones.
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._snapshots: "OrderedDict[int, Tuple[Dict[str, int], Dict[str, Dict[int, dict]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.table_loads = 0
+
+    def current(self) -> Tuple[int, Dict[str, int], Dict[str, Dict[int, dict]]]:
+        with get_read_session() as s:
+            version = sum(_table_versions(s).values())
+            with self._lock:
+                cached = self._snapshots.get(version)
+            if cached is not None:
+                return (version, *cached)
+        return self._load()
+
+    def _load(self) -> Tuple[int, Dict[str, int], Dict[str, Dict[int, dict]]]:
+        with get_read_session() as s:
+            # One read transaction, so the label and the rows describe the same commit.
+            begin_read(s)
+            versions = _table_versions(s)
+            version = sum(versions.values())
+            with self._lock:
+                previous_versions, previous = next(reversed(self._snapshots.values()), ({}, {}))
+            snapshot = {}
+            for name, model in API_TABLES:
+                before = previous.get(name)
+                if before is not None and name in versions and previous_versions.get(name) == versions[name]:
+                    snapshot[name] = before
+                    continue
+                before = before or {}
+                columns = COLUMNS[name]
+                table = model.__table__
+                rows = {}
+                for values in s.execute(select(*(table.c[column] for column in columns))):
+                    row = {column: _plain(value) for column, value in zip(columns, values)}
+                    old = before.get(row["id"])
+                    rows[row["id"]] = old if old == row else row
+                snapshot[name] = rows
+                self.table_loads += 1
+        with self._lock:
+            self._snapshots[version] = (versions, snapshot)
+            self._snapshots.move_to_end(version)
+            while len(self._snapshots) > self.size:
+                self._snapshots.popitem(last=False)
+        return version, versions, snapshot
+
+    def delta(self, since: Optional[int] = None) -> dict:
+        version, versions, snapshot = self.current()
+        with self._lock:
+            base = self._snapshots.get(since) if since is not None else None
+        if base is None:
+            # Unknown or expired label (or one handed out by another process): start over.
+            return {
+                "version": version,
+                "full": True,
+                "changed": {name: list(rows.values()) for name, rows in snapshot.items()},
+                "removed": {},
+            }
+        base_versions, base = base
+        changed, removed = {}, {}
+        for name, rows in snapshot.items():
+            if name in versions and base_versions.get(name) == versions[name]:
+                continue
+            before = base.get(name, {})
+            updates = []
+            for row_id, row in rows.items():
+                old = before.get(row_id)
+                if old is not row and old != row:
+                    updates.append(row)
+            gone = [row_id for row_id in before if row_id not in rows]
+            if updates:
+                changed[name] = updates
+            if gone:
+                removed[name] = gone
+        return {"version": version, "since": since, "full": False, "changed": changed, "removed": removed}
+
+
+def state_history() -> StateHistory:
+    return current_tenant().local("api_history", lambda: StateHistory(settings.api_history_size))
+
+
+def encode(payload: dict, media_type: str, compress: bool) -> Tuple[bytes, Dict[str, str]]:
+    if media_type == "application/msgpack":
+        if msgpack is None:
+            raise ValueError("msgpack is not installed on this server")
+        body = msgpack.packb(payload, use_bin_type=True)
+    else:
+        body = json.dumps(payload, separators=(",", ":")).encode()
+    headers = {"Content-Type": media_type, "Vary": "Accept, Accept-Encoding"}
+    if compress and len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
@@ -0,0 +1,70 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import DateTime, delete, func, insert, literal
+from sqlmodel import select
+
+from .clock import utcnow
+from .metrics import timed
+from .models import Dispatch, DispatchArchive, Incident, IncidentArchive
+from .repo import get_read_session, get_session
+from .services import engine_lock
+
+CLOSED_STATUSES = ("resolved", "failed")
+HISTORY_PAGE_SIZE = 12
+# Rows moved per statement; keeps IN-lists well under SQLite's variable limit.
+ARCHIVE_CHUNK = 500
+
+
+def _move(session, source, target, ids: List[int], now: datetime):
+    names = [column.name for column in source.__table__.columns]
+    columns = [source.__table__.c[name] for name in names] + [literal(now, DateTime())]
+    for start in range(0, len(ids), ARCHIVE_CHUNK):
+        chunk = ids[start : start + ARCHIVE_CHUNK]
+        rows = select(*columns).where(source.id.in_(chunk))
+        session.execute(insert(target).from_select(names + ["archived_at"], rows))
+        session.execute(delete(source).where(source.id.in_(chunk)))
+
+
+@timed()
+def archive_closed() -> dict:
+    # Moves closed incidents and finished dispatches out of the hot tables so tick,
+    # dispatch and the dashboard only ever touch live rows.
+    now = utcnow()
+    with engine_lock(), get_session() as s:
+        # SQLite hands out max(id) + 1, so the newest row stays behind or its id
+        # could be reused and collide with the archived copy.
+        newest_incident = s.exec(select(func.max(Incident.id))).one() or 0
+        newest_dispatch = s.exec(select(func.max(Dispatch.id))).one() or 0
+        dispatch_ids = s.exec(select(Dispatch.id).where(Dispatch.active.is_(False), Dispatch.id < newest_dispatch)).all()
+        _move(s, Dispatch, DispatchArchive, list(dispatch_ids), now)
+        # Incidents still referenced by a dispatch row (units still returning, or the
+        # newest dispatch kept back above) keep their row for the foreign key.
+        referenced = select(Dispatch.incident_id)
+        incident_ids = s.exec(
+            select(Incident.id).where(
+                Incident.status.in_(CLOSED_STATUSES),
+                Incident.id < newest_incident,
+                Incident.id.not_in(referenced),
+            )
+        ).all()
+        _move(s, Incident, IncidentArchive, list(incident_ids), now)
+        s.commit()
+    return {"incidents": len(incident_ids), "dispatches": len(dispatch_ids)}
+
+
+def history_page(before_id: Optional[int] = None, limit: int = HISTORY_PAGE_SIZE) -> Tuple[list, Optional[int]]:
+    # Keyset pagination over closed incidents, newest first, across the hot table
+    # (recently closed) and the archive. Returns the page and the cursor for the next.
+    rows = []
+    with get_read_session() as s:
+        for model, query in (
+            (Incident, select(Incident).where(Incident.status.in_(CLOSED_STATUSES))),
+            (IncidentArchive, select(IncidentArchive)),
+        ):
+            if before_id is not None:
+                query = query.where(model.id < before_id)
+            rows += s.exec(query.order_by(model.id.desc()).limit(limit + 1)).all()
+    rows.sort(key=lambda inc: inc.id, reverse=True)
+    page = rows[:limit]
+    return page, (page[-1].id if len(rows) > limit else None)
@@ -0,0 +1,146 @@
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from sqlmodel import select
+
+from .api import encode, state_history
+from .clock import ManualClock, get_clock, rng, set_clock
+from .models import Incident, Unit
+from .repo import get_read_session, init_db, use_database
+from .seed import seed_synthetic
+from .services import TICK_INTERVAL_S, dispatch_unit, spawn_incident, tick
+from .simulation import DEFAULT_START
+from .snapshot import restore_snapshot, save_snapshot
+from .spawner import spawn_burst
+from .world import memory_tick, memory_world
+
+
+def _summary(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _time(fn: Callable, repeat: int, before: Callable = None) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _throughput(samples: List[float]) -> dict:
+    result = _summary(samples)
+    result["ops_per_s"] = round(len(samples) / sum(samples), 1) if sum(samples) else None
+    return result
+
+
+def run_benchmarks(stations: int, units: int, incidents: int, personnel: int, repeat: int = 20, seed: int = 0) -> dict:
+    # Imported here so the engine benchmarks do not pay for FastAPI/Jinja setup.
+    from . import main
+
+    clock = ManualClock(DEFAULT_START)
+    previous_clock = get_clock()
+    set_clock(clock)
+    rng.seed(seed)
+    results = {
+        "world": {"stations": stations, "units": units, "incidents": incidents, "personnel": personnel},
+        "repeat": repeat,
+        "seed": seed,
+    }
+    try:
+        with tempfile.TemporaryDirectory() as tmp, use_database(f"sqlite:///{Path(tmp) / 'bench.db'}"):
+            init_db()
+            started = time.perf_counter()
+            seed_synthetic(stations, units, incidents, personnel, seed=seed)
+            results["seed_s"] = round(time.perf_counter() - started, 3)
+
+            results["build_world_state"] = _summary(_time(main._load_world_state, repeat))
+            ctx = dict(main._load_world_state())
+            ctx["generated_at"] = clock.now()
+            results["render"] = {
+                template_name: _summary(_time(lambda: main.templates.get_template(template_name).render(ctx), repeat))
+                for template_name in main.PANEL_DEPENDENCIES
+            }
+            # Every row re-rendered, as after a reset; "render" above reuses cached rows.
+            results["render_cold"] = {
+                template_name: _summary(
+                    _time(
+                        lambda: main.templates.get_template(template_name).render(ctx),
+                        repeat,
+                        before=main.fragment_cache.clear,
+                    )
+                )
+                for template_name in main.PANEL_DEPENDENCIES
+            }
+
+            with get_read_session() as s:
+                open_ids = s.exec(select(Incident.id).where(Incident.status == "new")).all()
+                unit_ids = s.exec(select(Unit.id).where(Unit.status == "available")).all()
+            pairs = list(zip(open_ids, unit_ids))[:repeat]
+            pairs_iter = iter(pairs)
+            results["dispatch_unit"] = _throughput(_time(lambda: dispatch_unit(*next(pairs_iter)), len(pairs)))
+            results["spawn_incident"] = _throughput(_time(spawn_incident, repeat))
+            results["tick"] = _summary(_time(tick, repeat, before=lambda: clock.advance(TICK_INTERVAL_S)))
+            memory_world().refresh()  # the first load is a one-off, not part of a tick
+            results["memory_tick"] = _summary(
+                _time(memory_tick, repeat, before=lambda: clock.advance(TICK_INTERVAL_S))
+            )
+            # What an API client pays per poll: the whole world once, then one tick's changes.
+            results["api_world_full"] = _summary(
+                _time(lambda: encode(state_history().delta(), "application/json", True), repeat)
+            )
+            seen = [state_history().delta()["version"]]
+
+            def api_delta():
+                payload = state_history().delta(seen[0])
+                seen[0] = payload["version"]
+                encode(payload, "application/json", True)
+
+            results["api_world_delta"] = _summary(
+                _time(api_delta, repeat, before=lambda: (clock.advance(TICK_INTERVAL_S), tick()))
+            )
+            # Last: every burst adds 50 incidents to the world the other timings ran against.
+            results["spawn_burst_mass_casualty"] = _throughput(_time(lambda: spawn_burst("mass_casualty"), repeat))
+            snapshot = Path(tmp) / "world.sqlite.gz"
+            results["snapshot_save"] = _summary(_time(lambda: save_snapshot(snapshot), repeat))
+            results["snapshot_restore"] = _summary(_time(lambda: restore_snapshot(snapshot), repeat))
+    finally:
+        set_clock(previous_clock)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tick, spawn, dispatch, partial rendering and snapshots.")
+    parser.add_argument("--stations", type=int, default=10)
+    parser.add_argument("--units", type=int, default=200)
+    parser.add_argument("--incidents", type=int, default=500)
+    parser.add_argument("--personnel", type=int, default=600)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.stations, args.units, args.incidents, args.personnel, args.repeat, args.seed)
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload + "\n")
+    else:
+        sys.stdout.write(payload + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+class WorldVersions:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables: Dict[str, int] = {}
+        self._listeners: List[Callable[[Set[str]], None]] = []
+        # Last database-side version seen per table; see observe().
+        self._shared: Dict[str, int] = {}
+        self.world = 0
+
+    def add_listener(self, listener: Callable[[Set[str]], None]):
+        self._listeners.append(listener)
+
+    def _count(self, tables: Set[str], world: bool):
+        # Caller holds self._lock.
+        if world:
+            self.world += 1
+        for name in tables:
+            self._tables[name] = self._tables.get(name, 0) + 1
+
+    def _notify(self, tables: Set[str]):
+        for listener in self._listeners:
+            listener(tables)
+
+    def bump(self, tables: Iterable[str], world: bool = True):
+        tables = set(tables)
+        if not tables:
+            return
+        with self._lock:
+            self._count(tables, world)
+        self._notify(tables)
+
+    def observe(self, shared: Dict[str, int], volatile: Iterable[str] = ()):
+        # Applies versions read from the shared table-version rows, so commits made by
+        # other processes invalidate this one's caches. Each new value bumps the local
+        # counter once, however often it is observed. Shared and local counters move
+        # together, so an ETag built from the shared ones never runs ahead of the world
+        # snapshot it is served with.
+        with self._lock:
+            changed = {name for name, version in shared.items() if self._shared.get(name) != version}
+            if not changed:
+                return
+            self._shared.update(shared)
+            self._count(changed, bool(changed - set(volatile)))
+        self._notify(changed)
+
+    def get(self, name: str) -> int:
+        return self._tables.get(name, 0)
+
+    def shared(self, name: str) -> int:
+        # The database-side counter: the same in every process that has synced.
+        with self._lock:
+            return self._shared.get(name, 0)
+
+
+class SnapshotCache:
+    def __init__(self, versions: WorldVersions):
+        self._versions = versions
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Tuple[int, dict]] = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, build: Callable[[], dict]) -> dict:
+        version = self._versions.world
+        with self._lock:
+            cached = self._snapshot
+            if cached and cached[0] == version:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        # Build outside the lock; a bump during the build only costs one extra miss.
+        snapshot = build()
+        with self._lock:
+            if not self._snapshot or self._snapshot[0] <= version:
+                self._snapshot = (version, snapshot)
+        return snapshot
+
+    def stats(self) -> dict:
+        return {"version": self._versions.world, "hits": self.hits, "misses": self.misses}
+
+
+class VersionedValue:
+    # A value rebuilt lazily whenever a committed write touches one of `tables`.
+
+    def __init__(self, versions: WorldVersions, tables: Iterable[str], load: Callable[[], object]):
+        self._versions = versions
+        self._tables = tuple(tables)
+        self._load = load
+        self._lock = threading.Lock()
+        self._cached: Optional[Tuple[tuple, object]] = None
+
+    def get(self):
+        key = tuple(self._versions.get(name) for name in self._tables)
+        cached = self._cached
+        if cached and cached[0] == key:
+            return cached[1]
+        with self._lock:
+            if self._cached and self._cached[0] == key:
+                return self._cached[1]
+            value = self._load()
+            self._cached = (key, value)
+            return value
+
+
+class FragmentCache:
+    # LRU of rendered fragments (one table row, one unit card) keyed by the ids and
+    # versions of the rows they show, so a panel re-renders only rows that changed.
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, render: Callable[[], str]) -> str:
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+        fragment = render()
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
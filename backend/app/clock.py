@@ -0,0 +1,42 @@
+import random
+from datetime import datetime, timedelta
+
+
+class SystemClock:
+    def now(self) -> datetime:
+        return datetime.utcnow()
+
+
+class ManualClock:
+    # Only moves when told to; lets the simulation run days of game time without sleeping.
+
+    def __init__(self, start: datetime):
+        self._now = start
+
+    def now(self) -> datetime:
+        return self._now
+
+    def advance(self, seconds: float):
+        self._now += timedelta(seconds=seconds)
+
+    def advance_to(self, moment: datetime):
+        self._now = max(self._now, moment)
+
+
+_clock = SystemClock()
+
+# All game randomness draws from this instance so a run can be replayed from its seed.
+rng = random.Random()
+
+
+def utcnow() -> datetime:
+    return _clock.now()
+
+
+def get_clock():
+    return _clock
+
+
+def set_clock(clock):
+    global _clock
+    _clock = clock
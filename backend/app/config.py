@@ -0,0 +1,68 @@
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="ALARM_", env_file=".env", extra="ignore")
+
+    database_url: str = "sqlite:///./game.db"
+    # Optional replica for dashboard reads on a server database; SQLite reads use a
+    # second query-only engine on the same file.
+    read_database_url: Optional[str] = None
+    echo_sql: bool = False
+
+    sqlite_journal_mode: str = "wal"
+    sqlite_synchronous: str = "normal"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout_s: float = 30.0
+
+    # Run the batch dispatcher on a schedule; 0 leaves dispatching to the operators.
+    auto_dispatch_interval_s: int = 0
+    # Only the holder of the engine lease runs tick/spawn/dispatch jobs, so any number of
+    # web workers can share one database; the others just poll for version changes.
+    engine_lease_ttl_s: float = 20.0
+    version_sync_interval_s: float = 1.0
+
+    # "memory" ticks against rows held in memory and writes back only what changed,
+    # holding the database write lock from its reload check to the write-back.
+    engine_mode: str = "database"
+
+    # "fixed" spawns one incident per spawn run; "poisson" and "time_of_day" draw the
+    # number from a Poisson process averaging spawn_rate_per_hour (see spawner.py).
+    spawn_mode: str = "fixed"
+    spawn_rate_per_hour: float = 80.0
+
+    # Extra dispatch centers besides "default", comma-separated; each gets its own
+    # database from tenant_database_url. Requests pick one with ?tenant= (remembered
+    # in a cookie) or an X-Tenant header.
+    tenants: str = ""
+    tenant_database_url: str = "sqlite:///./tenants/{tenant}.db"
+    # Engines (connection pools) kept open at once; least recently used ones are closed.
+    max_open_tenants: int = 32
+    # Engine processes split the tenants by crc32(name) % tenant_shards; each runs the
+    # jobs for its own slice, with the per-tenant lease still guarding against doubles.
+    tenant_shards: int = 1
+    tenant_shard: int = 0
+
+    # Rendered rows kept for reassembling panels; a few per unit, crew member and history row.
+    fragment_cache_size: int = 5000
+
+    # Compressed world snapshots, one folder per tenant (see snapshot.py). When
+    # seed_snapshot is set, startup and /admin/reset restore it instead of seeding.
+    snapshot_dir: str = "./snapshots"
+    seed_snapshot: Optional[str] = None
+
+    # World snapshots each process keeps for answering /api/world?since= with a delta;
+    # older versions get the full state again.
+    api_history_size: int = 16
+
+    # Move closed incidents and finished dispatches to the archive tables; 0 disables it.
+    archive_interval_s: int = 300
+
+
+settings = Settings()
@@ -0,0 +1,145 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+
+from sqlmodel import select
+
+from .clock import utcnow
+from .metrics import timed
+from .models import Incident, Personnel, Unit
+from .repo import begin_write, get_session
+from .services import assign_unit, crew_ready, engine_lock, requirement_counts, travel_time_s
+from .spatial import GridIndex, Site
+
+# Units considered per open slot; keeps the cost matrix small under surge load.
+CANDIDATES_PER_SLOT = 6
+# Added to a pairing whose arrival would land after the incident's deadline.
+LATE_PENALTY_S = 10_000
+UNREACHABLE = float("inf")
+
+DISPATCH_KINDS = {"fire": "need_fire", "ambulance": "need_ambulance"}
+
+
+def solve_assignment(cost: Sequence[Sequence[float]]) -> List[Tuple[int, int]]:
+    # Hungarian algorithm (shortest augmenting path with potentials) for a
+    # rectangular matrix; returns (row, col) pairs with finite cost, minimising
+    # their total. Runs in O(rows^2 * cols).
+    rows = len(cost)
+    cols = len(cost[0]) if rows else 0
+    if not rows or not cols:
+        return []
+    if rows > cols:
+        transposed = [[cost[r][c] for r in range(rows)] for c in range(cols)]
+        return [(r, c) for c, r in solve_assignment(transposed)]
+
+    # Unreachable pairs become a large finite cost so every row can still be placed.
+    finite = [value for row in cost for value in row if value != UNREACHABLE]
+    big = (max(finite) if finite else 0) * (rows + 1) + 1
+    matrix = [[big if value == UNREACHABLE else value for value in row] for row in cost]
+
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (cols + 1)
+    match = [0] * (cols + 1)  # match[col] = row (1-based), 0 = free
+    way = [0] * (cols + 1)
+    for row in range(1, rows + 1):
+        match[0] = row
+        col0 = 0
+        minv = [float("inf")] * (cols + 1)
+        used = [False] * (cols + 1)
+        while True:
+            used[col0] = True
+            row0 = match[col0]
+            delta = float("inf")
+            col1 = 0
+            for col in range(1, cols + 1):
+                if used[col]:
+                    continue
+                current = matrix[row0 - 1][col - 1] - u[row0] - v[col]
+                if current < minv[col]:
+                    minv[col] = current
+                    way[col] = col0
+                if minv[col] < delta:
+                    delta = minv[col]
+                    col1 = col
+            for col in range(cols + 1):
+                if used[col]:
+                    u[match[col]] += delta
+                    v[col] -= delta
+                else:
+                    minv[col] -= delta
+            col0 = col1
+            if match[col0] == 0:
+                break
+        while col0:
+            col1 = way[col0]
+            match[col0] = match[col1]
+            col0 = col1
+
+    return [
+        (match[col] - 1, col - 1)
+        for col in range(1, cols + 1)
+        if match[col] and cost[match[col] - 1][col - 1] != UNREACHABLE
+    ]
+
+
+def _open_slots(session, now: datetime) -> Dict[str, List[Tuple[Incident, float]]]:
+    counts = requirement_counts(session)
+    slots: Dict[str, List[Tuple[Incident, float]]] = defaultdict(list)
+    for inc in session.exec(select(Incident).where(Incident.status.in_(["new", "responding"]))):
+        found = counts.get(inc.id, {})
+        remaining = (inc.due_at - now).total_seconds() if inc.due_at else UNREACHABLE
+        for kind, field in DISPATCH_KINDS.items():
+            for _ in range(getattr(inc, field) - found.get(kind, 0)):
+                slots[kind].append((inc, remaining))
+    return slots
+
+
+def _ready_units(session, now: datetime) -> Dict[str, Dict[int, Tuple[Unit, List[Personnel]]]]:
+    units = session.exec(select(Unit).where(Unit.status == "available", Unit.kind.in_(list(DISPATCH_KINDS)))).all()
+    crews: Dict[int, List[Personnel]] = defaultdict(list)
+    if units:
+        for member in session.exec(select(Personnel).where(Personnel.unit_id.in_([unit.id for unit in units]))):
+            crews[member.unit_id].append(member)
+    ready: Dict[str, Dict[int, Tuple[Unit, List[Personnel]]]] = defaultdict(dict)
+    for unit in units:
+        if crew_ready(unit, crews[unit.id], now):
+            ready[unit.kind][unit.id] = (unit, crews[unit.id])
+    return ready
+
+
+@timed()
+def auto_dispatch() -> int:
+    # Assigns crew-ready units to every unmet fire/ambulance requirement at once,
+    # minimising total travel time (with a penalty for arriving after the deadline),
+    # and commits all resulting dispatches in one transaction.
+    now = utcnow()
+    assigned = 0
+    with engine_lock(), get_session() as s:
+        begin_write(s)
+        slots = _open_slots(s, now)
+        ready = _ready_units(s, now)
+        for kind, kind_slots in slots.items():
+            units = ready.get(kind)
+            if not units or not kind_slots:
+                continue
+            index = GridIndex(Site(unit.id, unit.location_x, unit.location_y, kind=kind) for unit, _ in units.values())
+            nearest = index.nearest_batch([(inc.grid_x, inc.grid_y) for inc, _ in kind_slots], CANDIDATES_PER_SLOT)
+            columns = sorted({site.id for candidates in nearest for _, site in candidates})
+            position = {unit_id: col for col, unit_id in enumerate(columns)}
+            cost = [[UNREACHABLE] * len(columns) for _ in kind_slots]
+            travel_times: Dict[Tuple[int, int], int] = {}
+            for row, ((inc, remaining), candidates) in enumerate(zip(kind_slots, nearest)):
+                for _, site in candidates:
+                    travel = travel_time_s(units[site.id][0], inc.grid_x, inc.grid_y)
+                    if travel is None:
+                        continue
+                    col = position[site.id]
+                    travel_times[row, col] = travel
+                    cost[row][col] = travel + (LATE_PENALTY_S if travel > remaining else 0)
+            for row, col in solve_assignment(cost):
+                inc = kind_slots[row][0]
+                unit, crew = units[columns[col]]
+                assign_unit(s, inc, unit, crew, now, travel_times[row, col])
+                assigned += 1
+        s.commit()
+    return assigned
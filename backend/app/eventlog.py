@@ -0,0 +1,132 @@
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, insert
+from sqlmodel import Session, select
+
+from .models import GameEvent, state_columns
+from .repo import get_read_session
+
+# Unit status -> event kind; "available" depends on where the unit came from.
+UNIT_EVENT_KINDS = {
+    "enroute": "unit_dispatched",
+    "at_scene": "unit_arrived",
+    "returning": "unit_returning",
+    "broken": "unit_broken",
+    "maintenance": "unit_in_maintenance",
+}
+
+# Replay walks the log in id order; batches keep a long log from being loaded at once.
+REPLAY_BATCH = 1000
+
+
+def unit_event_kind(previous: str, status: str) -> str:
+    if status == "available":
+        return "unit_repaired" if previous == "maintenance" else "unit_returned"
+    return UNIT_EVENT_KINDS.get(status, f"unit_{status}")
+
+
+def _snapshot(obj) -> dict:
+    return {name: getattr(obj, name) for name in state_columns(obj.__table__)}
+
+
+def capture(kind: str, at: datetime, **sections) -> tuple:
+    # Snapshots each section (incident=inc, unit=[...]) now; ids are read when the
+    # event is written, so rows created in the same transaction get theirs.
+    captured = {
+        name: [(obj, _snapshot(obj)) for obj in value] if isinstance(value, (list, tuple)) else (value, _snapshot(value))
+        for name, value in sections.items()
+        if value is not None
+    }
+    return kind, at, captured
+
+
+def record(session: Session, kind: str, at: datetime, **sections):
+    # Buffers an event on the session; the whole batch is inserted with one statement
+    # when the session commits.
+    session.info.setdefault("pending_events", []).append(capture(kind, at, **sections))
+
+
+def record_captured(session: Session, events: List[tuple]):
+    session.info.setdefault("pending_events", []).extend(events)
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _row(obj, snapshot: dict) -> dict:
+    return {**snapshot, "id": getattr(obj, "id", None)}
+
+
+@event.listens_for(Session, "before_commit", insert=True)
+def _write_events(session):
+    pending = session.info.pop("pending_events", None)
+    if not pending:
+        return
+    session.flush()
+    rows = []
+    for kind, at, captured in pending:
+        data = {
+            name: [_row(obj, snapshot) for obj, snapshot in value] if isinstance(value, list) else _row(*value)
+            for name, value in captured.items()
+        }
+        single = {name: row for name, row in data.items() if isinstance(row, dict)}
+        rows.append(
+            {
+                "at": at,
+                "kind": kind,
+                "incident_id": single.get("incident", {}).get("id"),
+                "unit_id": single.get("unit", {}).get("id"),
+                "dispatch_id": single.get("dispatch", {}).get("id"),
+                "data": json.dumps(data, separators=(",", ":"), default=_encode),
+            }
+        )
+    session.execute(insert(GameEvent), rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_events(session):
+    session.info.pop("pending_events", None)
+
+
+def _as_dict(ev: GameEvent) -> dict:
+    return {
+        "id": ev.id,
+        "at": ev.at.isoformat(),
+        "kind": ev.kind,
+        "incident_id": ev.incident_id,
+        "unit_id": ev.unit_id,
+        "dispatch_id": ev.dispatch_id,
+        "data": json.loads(ev.data),
+    }
+
+
+def tail(after_id: int = 0, limit: int = 100) -> List[dict]:
+    with get_read_session() as s:
+        query = select(GameEvent).where(GameEvent.id > after_id).order_by(GameEvent.id).limit(limit)
+        return [_as_dict(ev) for ev in s.exec(query)]
+
+
+def rebuild(until: Optional[datetime] = None) -> Dict[str, dict]:
+    # Folds the log into {section: {id: row}} as it stood at `until` (default: now).
+    # Every event carries full rows, so applying them in order is enough.
+    state: Dict[str, dict] = {}
+    last_id = 0
+    with get_read_session() as s:
+        while True:
+            query = select(GameEvent).where(GameEvent.id > last_id)
+            if until is not None:
+                query = query.where(GameEvent.at <= until)
+            batch = s.exec(query.order_by(GameEvent.id).limit(REPLAY_BATCH)).all()
+            for ev in batch:
+                if ev.kind == "world_seeded":
+                    state = {}
+                for section, rows in json.loads(ev.data).items():
+                    table = state.setdefault(section, {})
+                    for row in rows if isinstance(rows, list) else [rows]:
+                        table.setdefault(row["id"], {}).update(row)
+            if len(batch) < REPLAY_BATCH:
+                return state
+            last_id = batch[-1].id
@@ -0,0 +1,68 @@
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from .models import LeaderLease
+from .repo import get_session
+
+
+class Lease:
+    # A row-level lease: whoever holds an unexpired row for `name` is the one process
+    # allowed to run the game engine. Holders renew well inside the TTL; if one dies,
+    # another takes over once the row expires.
+
+    def __init__(self, name: str, ttl_s: float):
+        self.name = name
+        self.ttl_s = ttl_s
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._valid_until = 0.0
+
+    @property
+    def held(self) -> bool:
+        # Judged on this process's monotonic clock, so a renewal that stalls past the
+        # TTL stops the jobs here before another process can have taken over.
+        return time.monotonic() < self._valid_until
+
+    def renew(self) -> bool:
+        started = time.monotonic()
+        # Wall clock, not the game clock: expiry is compared across processes.
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl_s)
+        try:
+            with get_session() as s:
+                conn = s.connection()
+                claimed = conn.execute(
+                    update(LeaderLease)
+                    .where(
+                        LeaderLease.name == self.name,
+                        or_(LeaderLease.holder == self.holder, LeaderLease.expires_at < now),
+                    )
+                    .values(holder=self.holder, expires_at=expires_at)
+                ).rowcount
+                if not claimed and conn.execute(select(LeaderLease.name).where(LeaderLease.name == self.name)).first() is None:
+                    conn.execute(insert(LeaderLease).values(name=self.name, holder=self.holder, expires_at=expires_at))
+                    claimed = 1
+                s.commit()
+        except (IntegrityError, OperationalError):
+            # Lost an insert race or the database was busy; keep whatever time is left.
+            return self.held
+        # Stop a quarter-TTL early to leave room for clock drift between hosts.
+        self._valid_until = started + self.ttl_s * 0.75 if claimed else 0.0
+        return bool(claimed)
+
+    def release(self):
+        if not self.held:
+            return
+        self._valid_until = 0.0
+        with get_session() as s:
+            s.connection().execute(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name, LeaderLease.holder == self.holder)
+                .values(holder="", expires_at=datetime.utcnow())
+            )
+            s.commit()
@@ -1,17 +1,76 @@
+import asyncio
+import logging
+import threading
+import time
+from functools import partial
 from datetime import datetime
 from pathlib import Path
+from types import MappingProxyType
+from typing import Optional
 
+import anyio
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
 from sqlmodel import select
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 from apscheduler.schedulers.background import BackgroundScheduler
-
-from .repo import init_db, get_session
+from sqlalchemy import func
+
+from . import eventlog
+from .api import encode, state_history
+from .archive import archive_closed, history_page
+from .cache import FragmentCache
+from .clock import utcnow
+from .config import settings
+from .dispatcher import auto_dispatch
+from .leader import Lease
+from .metrics import (
+    Gauge,
+    job_duration,
+    job_errors,
+    job_skipped,
+    registry,
+    render_duration,
+    request_duration,
+    request_statements,
+    start_statement_count,
+    timed,
+)
+from .push import change_feed
+from .repo import (
+    DEFAULT_TENANT,
+    current_tenant,
+    engine_tenants,
+    get_read_session,
+    init_db,
+    is_known_tenant,
+    open_tenants,
+    reset_tenant,
+    set_tenant,
+    sync_versions,
+    touch_tables,
+    use_tenant,
+)
 from .models import GameState, Hospital, Incident, Personnel, Station, Unit
-from .services import BASE_GRID_SIZE, dispatch_unit, spawn_incident, tick
+from .services import (
+    BASE_GRID_SIZE,
+    OPEN_STATUSES,
+    SPAWN_INTERVAL_S,
+    TICK_INTERVAL_S,
+    backfill_due_times,
+    dispatch_unit,
+    hot_query_plans,
+    tick,
+)
+from .routing import road_router, set_road
 from .seed import seed
+from .snapshot import list_snapshots, restore_snapshot, save_snapshot, snapshot_path
+from .spawner import BURST_SCENARIOS, SpawnScheduler, make_rate, spawn_burst
+from .world import memory_tick
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -20,45 +79,263 @@ app = FastAPI(title="112 Alarm – MVP")
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
+SSE_KEEPALIVE_S = 15
+TENANT_COOKIE = "tenant"
+
+log = logging.getLogger(__name__)
+
+
+@app.middleware("http")
+async def _select_tenant(request: Request, call_next):
+    # Everything below (sessions, caches, the SSE feed) follows the tenant set here;
+    # worker threads inherit it through the copied context.
+    chosen = request.query_params.get("tenant")
+    name = request.headers.get("x-tenant") or chosen or request.cookies.get(TENANT_COOKIE) or DEFAULT_TENANT
+    if not is_known_tenant(name):
+        return JSONResponse({"error": f"unknown tenant {name!r}"}, status_code=404)
+    token = set_tenant(name)
+    try:
+        response = await call_next(request)
+    finally:
+        reset_tenant(token)
+    if chosen:
+        response.set_cookie(TENANT_COOKIE, name, httponly=True, samesite="lax")
+    return response
+
+
+@app.middleware("http")
+async def _instrument_request(request: Request, call_next):
+    tally = start_statement_count()
+    started = time.perf_counter()
+    response = await call_next(request)
+    # The matched route's template ("/partials/{name}") keeps label cardinality bounded.
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    request_duration.observe(time.perf_counter() - started, method=request.method, route=route)
+    request_statements.observe(tally[0], method=request.method, route=route)
+    return response
+
+
+# Tables each partial reads; "clock" covers the deadline countdown, which moves once per tick.
+# The same map drives ETags and which SSE refresh events a change fans out to.
+PANEL_DEPENDENCIES = {
+    "partials/incidents.html": ("incident", "unit", "clock"),
+    "partials/units.html": ("unit", "personnel"),
+    "partials/history.html": ("incident", "incidentarchive"),
+    "partials/map.html": ("incident", "unit", "hospital", "station"),
+    "partials/personnel.html": ("personnel", "unit"),
+    "partials/status.html": ("gamestate", "incident"),
+}
+
+# Last rendered body per (tenant, partial), so N clients refreshing on one change cost one render.
+_rendered_partials = {}
+_render_lock = threading.Lock()
+
+fragment_cache = FragmentCache(settings.fragment_cache_size)
+
+
+def _fragment(template_name: str, key: tuple, **ctx) -> Markup:
+    # Ids and versions start over when the world is reseeded, hence the "reset" epoch.
+    tenant = current_tenant()
+    full_key = (tenant.name, template_name, tenant.versions.get("reset"), key)
+    return Markup(fragment_cache.get(full_key, lambda: templates.get_template(template_name).render(ctx)))
+
+
+def _unit_card(unit, crew) -> Markup:
+    key = (unit.id, unit.version, tuple((member.id, member.version) for member in crew))
+    return _fragment("partials/unit_card.html", key, u=unit, crew=crew)
+
+
+def _personnel_row(member, unit) -> Markup:
+    key = (member.id, member.version, unit.name if unit else None)
+    return _fragment("partials/personnel_row.html", key, member=member, unit=unit)
+
+
+def _history_row(inc) -> Markup:
+    return _fragment("partials/history_row.html", (inc.id, inc.version), inc=inc)
+
+
+templates.env.globals.update(unit_card=_unit_card, personnel_row=_personnel_row, history_row=_history_row)
+
+
+# Async handlers hand session and template work to threads so the event loop keeps
+# serving polls and SSE; capped at what the connection pool can actually serve.
+_db_limiter = anyio.CapacityLimiter(settings.pool_size + settings.max_overflow)
+
+
+async def _offload(fn, *args):
+    return await anyio.to_thread.run_sync(partial(fn, *args), limiter=_db_limiter)
+
+
+def _engine_lease() -> Lease:
+    # Exactly one process (across all uvicorn workers) runs each tenant's engine at a time.
+    return current_tenant().local("engine_lease", lambda: Lease("engine", settings.engine_lease_ttl_s))
+
+
+def _spawner() -> SpawnScheduler:
+    return current_tenant().local(
+        "spawner", lambda: SpawnScheduler(make_rate(settings.spawn_mode, settings.spawn_rate_per_hour))
+    )
+
+
+def _each_engine_tenant(name: str, job, leading_only: bool = True):
+    # One scheduler job per kind of work, looping over this process's shard of tenants;
+    # a failing tenant is counted and logged without starving the rest.
+    for tenant_name in engine_tenants():
+        with use_tenant(tenant_name):
+            if leading_only and not _engine_lease().held:
+                continue
+            started = time.perf_counter()
+            try:
+                job()
+            except Exception:
+                job_errors.inc(job=name)
+                log.exception("%s failed for tenant %s", name, tenant_name)
+            finally:
+                job_duration.observe(time.perf_counter() - started, job=name)
+
+
+def _engine_job(name: str, job):
+    return partial(_each_engine_tenant, name, job)
+
+
+def _renew_leases():
+    _each_engine_tenant("engine-lease", lambda: _engine_lease().renew(), leading_only=False)
+
+
+def _sync_open_tenants():
+    # Only tenants with an open engine have caches worth refreshing.
+    for tenant in open_tenants():
+        with use_tenant(tenant.name):
+            sync_versions()
+
+
+def _start_tenant(name: str):
+    init_db()
+    # The first worker up takes the lease and resets the default world, as a single
+    # process always did; other tenants keep their world across restarts.
+    if _engine_lease().renew():
+        backfill_due_times()
+        if name == DEFAULT_TENANT or not _has_world():
+            _reseed()
+
+
+def _reseed():
+    if settings.seed_snapshot:
+        restore_snapshot(settings.seed_snapshot)
+    else:
+        seed()
+
+
+def _has_world() -> bool:
+    with get_read_session() as s:
+        return s.get(GameState, 1) is not None
+
+
+def _count_skipped_job(event):
+    reason = "overlap" if event.code == EVENT_JOB_MAX_INSTANCES else "missed"
+    job_skipped.inc(job=event.job_id, reason=reason)
+
 
 @app.on_event("startup")
 def on_startup():
-    init_db()
-    seed()
+    for name in engine_tenants():
+        with use_tenant(name):
+            _start_tenant(name)
     scheduler = BackgroundScheduler()
-    scheduler.add_job(tick, "interval", seconds=10, id="tick")
-    scheduler.add_job(spawn_incident, "interval", seconds=45, id="spawn")
+    scheduler.add_job(_renew_leases, "interval", seconds=settings.engine_lease_ttl_s / 4, id="engine-lease")
+    scheduler.add_job(_sync_open_tenants, "interval", seconds=settings.version_sync_interval_s, id="sync-versions")
+    scheduler.add_job(_engine_job("tick", _tick_job), "interval", seconds=TICK_INTERVAL_S, id="tick")
+    scheduler.add_job(_engine_job("spawn", lambda: _spawner().run()), "interval", seconds=SPAWN_INTERVAL_S, id="spawn")
+    if settings.auto_dispatch_interval_s > 0:
+        scheduler.add_job(
+            _engine_job("auto-dispatch", auto_dispatch),
+            "interval",
+            seconds=settings.auto_dispatch_interval_s,
+            id="auto-dispatch",
+        )
+    if settings.archive_interval_s > 0:
+        scheduler.add_job(
+            _engine_job("archive", archive_closed), "interval", seconds=settings.archive_interval_s, id="archive"
+        )
+    scheduler.add_listener(_count_skipped_job, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+    scheduler.add_listener(lambda event: job_errors.inc(job=event.job_id), EVENT_JOB_ERROR)
     scheduler.start()
+    app.state.scheduler = scheduler
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    scheduler = getattr(app.state, "scheduler", None)
+    if scheduler:
+        scheduler.shutdown(wait=True)
+    # Hand over straight away instead of making the next process wait out the TTL.
+    for name in engine_tenants():
+        with use_tenant(name):
+            _engine_lease().release()
+
+
+def _tick_job():
+    (memory_tick if settings.engine_mode == "memory" else tick)()
+    touch_tables(("clock",))
+
+
+def _map_cells(incidents, units, hospitals, stations):
+    # Sparse (x, y) -> markers index so the map template does one lookup per cell
+    # instead of filtering every entity list for every cell.
+    cells = {}
+    for marker, positions in (
+        ("incident", ((inc.grid_x, inc.grid_y) for inc in incidents)),
+        ("unit", ((unit.location_x, unit.location_y) for unit in units)),
+        ("hospital", ((h.grid_x, h.grid_y) for h in hospitals)),
+        ("station", ((st.grid_x, st.grid_y) for st in stations)),
+    ):
+        for position in positions:
+            cells.setdefault(position, set()).add(marker)
+    return MappingProxyType({position: frozenset(markers) for position, markers in cells.items()})
+
+
+@timed()
+def _load_world_state():
+    with get_read_session() as s:
+        # Closed incidents are paged in from history_page(); the hot path never loads them all.
+        active_incidents = tuple(
+            s.exec(select(Incident).where(Incident.status.in_(OPEN_STATUSES)).order_by(Incident.id.desc())).all()
+        )
+        units = tuple(s.exec(select(Unit)).all())
+        hospitals = tuple(s.exec(select(Hospital)).all())
+        stations = tuple(s.exec(select(Station)).all())
+        personnel = tuple(s.exec(select(Personnel)).all())
+        gamestate = s.get(GameState, 1)
 
+    history, history_next = history_page()
+    crew_by_unit = {}
+    for member in personnel:
+        crew_by_unit.setdefault(member.unit_id, []).append(member)
+
+    return MappingProxyType(
+        {
+            "units": units,
+            "hospitals": hospitals,
+            "stations": stations,
+            "personnel": personnel,
+            "crew_by_unit": MappingProxyType({unit_id: tuple(crew) for unit_id, crew in crew_by_unit.items()}),
+            "units_by_id": MappingProxyType({unit.id: unit for unit in units}),
+            "gamestate": gamestate,
+            "grid_size": BASE_GRID_SIZE,
+            "active_incidents": active_incidents,
+            "map_cells": _map_cells(active_incidents, units, hospitals, stations),
+            "history_incidents": tuple(history),
+            "history_next": history_next,
+            "available_units": tuple(unit for unit in units if unit.status == "available"),
+        }
+    )
 
-def _build_world_state():
-    with get_session() as s:
-        incidents = s.exec(select(Incident).order_by(Incident.id.desc())).all()
-        units = s.exec(select(Unit)).all()
-        hospitals = s.exec(select(Hospital)).all()
-        stations = s.exec(select(Station)).all()
-        personnel = s.exec(select(Personnel)).all()
-        gamestate = s.get(GameState, 1)
 
-    active_statuses = {"new", "responding", "resolving"}
-    history_statuses = {"resolved", "failed"}
-
-    active_incidents = [inc for inc in incidents if inc.status in active_statuses]
-    history_incidents = [inc for inc in incidents if inc.status in history_statuses]
-    available_units = [unit for unit in units if unit.status == "available"]
-    return {
-        "incidents": incidents,
-        "units": units,
-        "hospitals": hospitals,
-        "stations": stations,
-        "personnel": personnel,
-        "gamestate": gamestate,
-        "grid_size": BASE_GRID_SIZE,
-        "generated_at": datetime.utcnow(),
-        "active_incidents": active_incidents,
-        "history_incidents": history_incidents,
-        "available_units": available_units,
-    }
+def _build_world_state():
+    # Partials share one read-only snapshot per world version; only the clock is per request.
+    ctx = dict(current_tenant().snapshots.get(_load_world_state))
+    ctx["generated_at"] = utcnow()
+    return ctx
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -68,10 +345,53 @@ def index(request: Request):
     return templates.TemplateResponse("index.html", ctx)
 
 
+def _panel_etag(template_name: str) -> str:
+    # Built from the shared table versions, so every worker hands out the same tag for
+    # the same data and a client can revalidate against any of them.
+    tenant = current_tenant()
+    versions = "-".join(str(tenant.versions.shared(name)) for name in PANEL_DEPENDENCIES[template_name])
+    return f'"{tenant.name}-{Path(template_name).stem}-{versions}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip() for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
 def _partial_response(request: Request, template_name: str):
-    ctx = _build_world_state()
-    ctx["request"] = request
-    return templates.TemplateResponse(template_name, ctx)
+    etag = _panel_etag(template_name)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(_render_partial(template_name, etag), headers=headers)
+
+
+def _render_partial(template_name: str, etag: str) -> str:
+    slot = (current_tenant().name, template_name)
+    cached = _rendered_partials.get(slot)
+    if cached and cached[0] == etag:
+        return cached[1]
+    with _render_lock:
+        cached = _rendered_partials.get(slot)
+        if cached and cached[0] == etag:
+            return cached[1]
+        ctx = _build_world_state()
+        started = time.perf_counter()
+        content = templates.get_template(template_name).render(ctx)
+        render_duration.observe(time.perf_counter() - started, template=template_name)
+        _rendered_partials[slot] = (etag, content)
+    return content
+
+
+def _panel_events(tables) -> list:
+    return [
+        f"refresh-{Path(template_name).stem}"
+        for template_name, dependencies in PANEL_DEPENDENCIES.items()
+        if tables.intersection(dependencies)
+    ]
 
 
 @app.get("/partials/incidents", response_class=HTMLResponse)
@@ -89,6 +409,15 @@ def partial_history(request: Request):
     return _partial_response(request, "partials/history.html")
 
 
+@app.get("/partials/history/page", response_class=HTMLResponse)
+def partial_history_page(request: Request, before: int):
+    history, history_next = history_page(before)
+    return templates.TemplateResponse(
+        "partials/history_rows.html",
+        {"request": request, "history_incidents": history, "history_next": history_next},
+    )
+
+
 @app.get("/partials/map", response_class=HTMLResponse)
 def partial_map(request: Request):
     return _partial_response(request, "partials/map.html")
@@ -104,21 +433,187 @@ def partial_status(request: Request):
     return _partial_response(request, "partials/status.html")
 
 
+def _incidents_panel(request: Request) -> str:
+    ctx = _build_world_state()
+    ctx["request"] = request
+    return templates.get_template("partials/incidents.html").render(ctx)
+
+
 @app.post("/dispatch", response_class=HTMLResponse)
 async def post_dispatch(request: Request, incident_id: int = Form(...), unit_id: int = Form(...)):
-    dispatch_unit(incident_id, unit_id)
+    await _offload(dispatch_unit, incident_id, unit_id)
     if request.headers.get("HX-Request"):
-        ctx = _build_world_state()
-        ctx["request"] = request
-        content = templates.get_template("partials/incidents.html").render(ctx)
-        response = HTMLResponse(content)
-        response.headers["HX-Trigger"] = "refresh-units,refresh-status,refresh-history,refresh-personnel,refresh-map"
-        return response
+        # Other panels refresh through the /events stream once the commit is published.
+        return HTMLResponse(await _offload(_incidents_panel, request))
     return RedirectResponse(url="/", status_code=303)
 
 
+@app.post("/dispatch/auto")
+async def post_auto_dispatch(request: Request):
+    assigned = await _offload(auto_dispatch)
+    if request.headers.get("HX-Request"):
+        return HTMLResponse(await _offload(_incidents_panel, request))
+    return JSONResponse({"assigned": assigned})
+
+
+@app.get("/events")
+async def events(request: Request):
+    feed = change_feed()
+    queue = feed.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    tables = set(await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_S))
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                # Coalesce bursts (tick + spawn, seed) into one refresh per panel.
+                while not queue.empty():
+                    tables |= queue.get_nowait()
+                for event in _panel_events(tables):
+                    yield f"event: {event}\ndata: {event}\n\n"
+        finally:
+            feed.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _per_tenant(collect):
+    # Gauges cover every tenant with an open engine, labelled by tenant.
+    def gather():
+        samples = []
+        for tenant in open_tenants():
+            with use_tenant(tenant.name):
+                samples += [({**labels, "tenant": tenant.name}, value) for labels, value in collect()]
+        return samples
+
+    return gather
+
+
+def _incident_gauge():
+    with get_read_session() as s:
+        rows = s.exec(select(Incident.status, func.count()).where(Incident.status.in_(OPEN_STATUSES)).group_by(Incident.status))
+        return [({"status": status}, count) for status, count in rows]
+
+
+def _unit_gauge():
+    with get_read_session() as s:
+        rows = s.exec(select(Unit.kind, Unit.status, func.count()).group_by(Unit.kind, Unit.status))
+        return [({"kind": kind, "status": status}, count) for kind, status, count in rows]
+
+
+def _hospital_gauge():
+    with get_read_session() as s:
+        return [
+            ({"hospital": h.name, "measure": measure}, value)
+            for h in s.exec(select(Hospital))
+            for measure, value in (("occupied", h.occupied), ("capacity", h.capacity))
+        ]
+
+
+registry.register(
+    Gauge("alarm_open_incidents", "Open incidents by status.", ["tenant", "status"], _per_tenant(_incident_gauge))
+)
+registry.register(
+    Gauge(
+        "alarm_units",
+        "Units by kind and status; anything but available is busy.",
+        ["tenant", "kind", "status"],
+        _per_tenant(_unit_gauge),
+    )
+)
+registry.register(
+    Gauge("alarm_hospital_beds", "Hospital beds occupied and total.", ["tenant", "hospital", "measure"], _per_tenant(_hospital_gauge))
+)
+
+
+@app.get("/api/world")
+def api_world(request: Request, since: Optional[int] = None, format: Optional[str] = None):
+    # The live world as entity rows; pass the returned "version" back as ?since= to get
+    # only the rows changed (and ids removed) since then. ?format=msgpack or an
+    # Accept: application/msgpack header switches the encoding; gzip follows Accept-Encoding.
+    wants_msgpack = format == "msgpack" or "application/msgpack" in request.headers.get("accept", "")
+    media_type = "application/msgpack" if wants_msgpack else "application/json"
+    compress = "gzip" in request.headers.get("accept-encoding", "")
+    try:
+        body, headers = encode(state_history().delta(since), media_type, compress)
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=406)
+    headers["Cache-Control"] = "no-cache"
+    return Response(body, headers=headers)
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/events/log")
+def event_log(after: int = 0, limit: int = 100):
+    # Consumers tail the log by passing the last id they saw as `after`.
+    return JSONResponse(eventlog.tail(after, min(limit, 1000)))
+
+
+@app.get("/admin/replay")
+def replay(at: Optional[datetime] = None):
+    return JSONResponse(jsonable_encoder(eventlog.rebuild(at)))
+
+
+@app.get("/admin/burst")
+def burst(scenario: str, city: Optional[str] = None):
+    if scenario not in BURST_SCENARIOS:
+        return JSONResponse({"error": f"unknown scenario, expected one of {sorted(BURST_SCENARIOS)}"}, status_code=404)
+    return JSONResponse({"scenario": scenario, "incident_ids": spawn_burst(scenario, city)})
+
+
+@app.get("/admin/road")
+def road(x: int, y: int, cost: float = 1.0, blocked: bool = False):
+    # cost=1 and not blocked turns the cell back into open road.
+    if not (0 <= x <= BASE_GRID_SIZE and 0 <= y <= BASE_GRID_SIZE) or cost <= 0:
+        return JSONResponse({"error": f"x and y must be within 0..{BASE_GRID_SIZE}, cost positive"}, status_code=400)
+    set_road(x, y, cost, blocked)
+    return JSONResponse(road_router(BASE_GRID_SIZE).stats())
+
+
 @app.get("/admin/reset")
 def reset():
-    seed()
+    _reseed()
     return RedirectResponse(url="/", status_code=303)
 
+
+@app.get("/admin/snapshot")
+def snapshot(name: Optional[str] = None):
+    try:
+        path = snapshot_path(name or utcnow().strftime("%Y%m%d-%H%M%S"))
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=400)
+    return JSONResponse({**save_snapshot(path), "snapshots": list_snapshots()})
+
+
+@app.get("/admin/restore")
+def restore(name: str):
+    try:
+        path = snapshot_path(name)
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=400)
+    if not path.exists():
+        return JSONResponse({"error": f"no snapshot {name!r}", "snapshots": list_snapshots()}, status_code=404)
+    return JSONResponse(restore_snapshot(path))
+
+
+@app.get("/admin/cache")
+def cache_stats():
+    return JSONResponse({**current_tenant().snapshots.stats(), "fragments": fragment_cache.stats()})
+
+
+@app.get("/admin/query-plans")
+def query_plans():
+    plans = hot_query_plans()
+    return JSONResponse({"full_scans": [p["query"] for p in plans if p["full_scan"]], "plans": plans})
@@ -0,0 +1,193 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Seconds; covers a sub-millisecond partial render up to a tick stuck behind a lock.
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _label_text(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}"
+
+
+class Gauge(Metric):
+    # Read at scrape time from `collect`, which yields (labels, value) pairs.
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect: Optional[Callable] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect() if self.collect else ():
+            yield f"{self.name}{_label_text(self.labelnames, self._key(labels))} {_number(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [per-bucket counts..., sum, count]
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                yield f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labelnames, key)} {_number(values[-2])}"
+            yield f"{self.name}_count{_label_text(self.labelnames, key)} {values[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+function_duration = registry.register(
+    Histogram("alarm_function_duration_seconds", "Wall time of instrumented service functions.", ["function"])
+)
+job_duration = registry.register(Histogram("alarm_job_duration_seconds", "Wall time of scheduler jobs.", ["job"]))
+job_skipped = registry.register(
+    Counter("alarm_job_skipped_total", "Scheduler runs missed or dropped because the previous run overlapped.", ["job", "reason"])
+)
+job_errors = registry.register(Counter("alarm_job_errors_total", "Scheduler runs that raised.", ["job"]))
+incidents_spawned = registry.register(
+    Counter("alarm_incidents_spawned_total", "Incidents created by the spawn scheduler or a burst scenario.", ["source"])
+)
+tick_dispatches = registry.register(
+    Histogram("alarm_tick_dispatch_transitions", "Dispatches whose timer came due in one tick.", buckets=COUNT_BUCKETS)
+)
+request_duration = registry.register(
+    Histogram("alarm_request_duration_seconds", "HTTP request wall time.", ["method", "route"])
+)
+request_statements = registry.register(
+    Histogram("alarm_request_sql_statements", "SQL statements executed per HTTP request.", ["method", "route"], COUNT_BUCKETS)
+)
+render_duration = registry.register(
+    Histogram("alarm_render_duration_seconds", "Partial template render time (cache misses only).", ["template"])
+)
+sql_statements = registry.register(Counter("alarm_sql_statements_total", "SQL statements executed by any engine."))
+
+
+def timed(name: Optional[str] = None):
+    # Records the wrapped function's wall time, including when it raises.
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                function_duration.observe(time.perf_counter() - started, function=label)
+
+        return wrapper
+
+    return decorate
+
+
+# Per-request statement tally; the middleware installs a fresh list and worker threads
+# inherit it through the copied context.
+_statement_count: ContextVar[Optional[list]] = ContextVar("alarm_statement_count", default=None)
+
+
+def start_statement_count() -> list:
+    tally = [0]
+    _statement_count.set(tally)
+    return tally
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    sql_statements.inc()
+    tally = _statement_count.get()
+    if tally is not None:
+        tally[0] += 1
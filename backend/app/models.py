@@ -1,13 +1,15 @@
 from __future__ import annotations
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, Tuple
 from datetime import datetime
+from sqlalchemy import Index, text
 from sqlmodel import SQLModel, Field
 
 
 class Station(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
-    city: str
+    city: str = Field(index=True)
     grid_x: int = 0
     grid_y: int = 0
 
@@ -15,13 +17,21 @@ class Station(SQLModel, table=True):
 class Hospital(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
-    city: str
+    city: str = Field(index=True)
     capacity: int = 10
     occupied: int = 0
     grid_x: int = 0
     grid_y: int = 0
 
 
+class RoadCell(SQLModel, table=True):
+    # Grid cells that are not plain open road; see routing.py.
+    x: int = Field(primary_key=True)
+    y: int = Field(primary_key=True)
+    cost: float = 1.0  # time to drive through, relative to open road
+    blocked: bool = False
+
+
 class GameState(SQLModel, table=True):
     id: Optional[int] = Field(default=1, primary_key=True)
     funds: int = 0
@@ -31,6 +41,8 @@ class GameState(SQLModel, table=True):
 
 
 class Unit(SQLModel, table=True):
+    __table_args__ = (Index("ix_unit_status_down_until", "status", "down_until"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     kind: str  # "fire" | "ambulance" | "police"
     name: str
@@ -43,9 +55,10 @@ class Unit(SQLModel, table=True):
     home_x: int = 0
     home_y: int = 0
     down_until: Optional[datetime] = None
+    version: int = 0  # bumped on every update; keys the rendered-row cache
 
 
-class Incident(SQLModel, table=True):
+class IncidentFields(SQLModel):
     id: Optional[int] = Field(default=None, primary_key=True)
     type: str  # fire | medical | traffic
     severity: int  # 1..5
@@ -61,17 +74,48 @@ class Incident(SQLModel, table=True):
     cash_reward: int = 0
     response_started_at: Optional[datetime] = None
     resolved_at: Optional[datetime] = None
+    due_at: Optional[datetime] = None  # next deadline or resolve time
+    version: int = 0
+
+
+class Incident(IncidentFields, table=True):
+    # Composite rather than partial: SQLAlchemy binds IN-lists as parameters, which
+    # SQLite cannot match against a partial index's status predicate.
+    __table_args__ = (Index("ix_incident_status_due_at", "status", "due_at"),)
 
 
-class Dispatch(SQLModel, table=True):
+class IncidentArchive(IncidentFields, table=True):
+    # Closed incidents moved out of the hot table; ids are kept from Incident.
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class DispatchFields(SQLModel):
     id: Optional[int] = Field(default=None, primary_key=True)
-    incident_id: int = Field(foreign_key="incident.id")
-    unit_id: int = Field(foreign_key="unit.id")
+    incident_id: int
+    unit_id: int
     assigned_at: datetime = Field(default_factory=datetime.utcnow)
     arrive_at: Optional[datetime] = None
     return_at: Optional[datetime] = None
     travel_time_s: int = 0
     active: bool = True
+    due_at: Optional[datetime] = None  # next arrive/return timer
+
+
+class Dispatch(DispatchFields, table=True):
+    __table_args__ = (
+        Index("ix_dispatch_active_due_at", "due_at", sqlite_where=text("active = 1")),
+        Index("ix_dispatch_active_incident_id", "incident_id", sqlite_where=text("active = 1")),
+    )
+
+    # Only active dispatches are looked up by incident: ix_dispatch_active_incident_id.
+    incident_id: int = Field(foreign_key="incident.id")
+    unit_id: int = Field(foreign_key="unit.id")
+
+
+class DispatchArchive(DispatchFields, table=True):
+    # Finished dispatches; incident_id may point at IncidentArchive, so no foreign keys.
+    incident_id: int = Field(index=True)
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 class Personnel(SQLModel, table=True):
@@ -82,4 +126,36 @@ class Personnel(SQLModel, table=True):
     fatigue: float = 0.0  # 0-100 scale
     on_shift: bool = False
     rest_until: Optional[datetime] = None
-    unit_id: Optional[int] = Field(default=None, foreign_key="unit.id")
+    unit_id: Optional[int] = Field(default=None, foreign_key="unit.id", index=True)
+    version: int = 0
+
+
+class TableVersion(SQLModel, table=True):
+    # Bumped in the same transaction as every write, so each process can tell what
+    # other processes changed (see repo.sync_versions).
+    name: str = Field(primary_key=True)
+    version: int = 0
+
+
+class LeaderLease(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+    holder: str = ""
+    expires_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class GameEvent(SQLModel, table=True):
+    # Append-only log of state transitions; see eventlog.py.
+    id: Optional[int] = Field(default=None, primary_key=True)
+    at: datetime = Field(index=True)
+    kind: str
+    incident_id: Optional[int] = None
+    unit_id: Optional[int] = None
+    dispatch_id: Optional[int] = None
+    data: str = "{}"  # compact JSON: {section: row or [rows]} as they stood after the change
+
+
+@lru_cache(maxsize=None)
+def state_columns(table) -> Tuple[str, ...]:
+    # Row versions are bookkeeping for the render cache, not game state, so event
+    # payloads and the JSON API leave them out.
+    return tuple(column.name for column in table.columns if column.name != "version")
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+from typing import Dict, Iterable
+
+from .repo import current_tenant
+
+
+class ChangeFeed:
+    # Fans table-change notifications out from scheduler/request threads to SSE streams.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, tables: Iterable[str]):
+        tables = frozenset(tables)
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, tables)
+            except RuntimeError:
+                # Loop already closed; the stream's finally block will unsubscribe.
+                pass
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+
+def _attached_feed(tenant) -> ChangeFeed:
+    feed = ChangeFeed()
+    tenant.versions.add_listener(feed.publish)
+    return feed
+
+
+def change_feed() -> ChangeFeed:
+    # One feed per tenant, so SSE clients only hear about their own world.
+    tenant = current_tenant()
+    return tenant.local("change_feed", lambda: _attached_feed(tenant))
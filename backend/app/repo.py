@@ -1,16 +1,451 @@
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event, insert, inspect, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import StaticPool
 from sqlmodel import SQLModel, Session, create_engine
 
+from .cache import SnapshotCache, WorldVersions
+from .config import Settings, settings
+from .models import TableVersion
 
-engine = create_engine("sqlite:///./game.db", echo=False)
+# Versioned like tables but never written as rows: "clock" moves once per tick.
+PSEUDO_TABLES = ("clock", "reset")
 
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def make_engine(url: str, config: Settings = settings, read_only: bool = False) -> Engine:
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return create_engine(
+            url,
+            echo=config.echo_sql,
+            pool_size=config.pool_size,
+            max_overflow=config.max_overflow,
+            pool_timeout=config.pool_timeout_s,
+            pool_pre_ping=True,
+        )
+
+    connect_args = {"check_same_thread": False, "timeout": config.sqlite_busy_timeout_ms / 1000}
+    if _is_memory_sqlite(url):
+        # A private in-memory database only exists on its one connection.
+        new_engine = create_engine(url, echo=config.echo_sql, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        new_engine = create_engine(
+            url,
+            echo=config.echo_sql,
+            connect_args=connect_args,
+            pool_size=config.pool_size,
+            max_overflow=config.max_overflow,
+            pool_timeout=config.pool_timeout_s,
+        )
+
+    @event.listens_for(new_engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not read_only and not _is_memory_sqlite(url):
+            cursor.execute(f"PRAGMA journal_mode={config.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={config.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={config.sqlite_busy_timeout_ms}")
+        cursor.execute(f"PRAGMA mmap_size={config.sqlite_mmap_size}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return new_engine
+
+
+def make_read_engine(write_engine: Engine, config: Settings = settings) -> Engine:
+    if config.read_database_url:
+        return make_engine(config.read_database_url, config, read_only=True)
+    if write_engine.url.get_backend_name() != "sqlite" or _is_memory_sqlite(write_engine.url):
+        return write_engine
+    # WAL lets this second pool read a consistent snapshot while the tick holds the write lock.
+    return make_engine(str(write_engine.url), config, read_only=True)
+
+
+DEFAULT_TENANT = "default"
+TENANT_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+
+
+class Tenant:
+    # One dispatch center: its own database, version counters and per-world caches.
+    # Engines open on first use and are closed again when the process holds more than
+    # max_open_tenants; counters and caches stay, so a reopened tenant resumes warm.
+
+    def __init__(self, name: str, url: str, config: Settings = settings, pinned: bool = False):
+        self.name = name
+        self.url = url
+        self.versions = WorldVersions()
+        self.snapshots = SnapshotCache(self.versions)
+        # Private in-memory databases die with their engine, so they are never evicted.
+        self.pinned = pinned or _is_memory_sqlite(make_url(url))
+        self._config = config
+        self._engines: Optional[Tuple[Engine, Engine]] = None
+        self._scratch: Optional[str] = None
+        self._initialized = False
+        self._locals: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self) -> Engine:
+        return self._open()[0]
+
+    @property
+    def read_engine(self) -> Engine:
+        return self._open()[1]
+
+    def _open(self) -> Tuple[Engine, Engine]:
+        engines = self._engines
+        if engines is None:
+            with self._lock:
+                if self._engines is None:
+                    url = make_url(self.url)
+                    if _is_memory_sqlite(url):
+                        # A private in-memory database lives on one shared connection, so
+                        # a read session would join the writer's open transaction (and roll
+                        # it back on close). A scratch file, deleted on close, gives it its
+                        # own read connections like any other SQLite world.
+                        self._scratch = tempfile.mkdtemp(prefix="alarm-")
+                        url = make_url(f"sqlite:///{Path(self._scratch) / 'world.db'}")
+                    elif url.get_backend_name() == "sqlite":
+                        Path(url.database).parent.mkdir(parents=True, exist_ok=True)
+                    write_engine = make_engine(str(url), self._config)
+                    if not self._initialized:
+                        _create_schema(write_engine)
+                        self._initialized = True
+                    read_engine = make_read_engine(write_engine, self._config)
+                    # Commits made while it was closed must invalidate the caches kept meanwhile.
+                    with read_engine.connect() as conn:
+                        self._observe(conn)
+                    self._engines = (write_engine, read_engine)
+                engines = self._engines
+        if not self.pinned:
+            _touch(self)
+        return engines
+
+    def _observe(self, conn) -> Dict[str, int]:
+        shared = dict(conn.execute(select(TableVersion.name, TableVersion.version)).all())
+        self.versions.observe(shared, PSEUDO_TABLES)
+        return shared
+
+    def sync(self, session=None) -> Dict[str, int]:
+        if session is not None:
+            return self._observe(session.connection())
+        with self.read_engine.connect() as conn:
+            return self._observe(conn)
+
+    def close(self):
+        with self._lock:
+            engines, self._engines = self._engines, None
+        if engines:
+            write_engine, read_engine = engines
+            if read_engine is not write_engine:
+                read_engine.dispose()
+            write_engine.dispose()
+        if self._scratch:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+            self._scratch = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._engines is not None
+
+    def local(self, key: str, factory: Callable[[], object]):
+        # Per-world singletons (spatial index, in-memory world, lease, ...).
+        with self._lock:
+            value = self._locals.get(key)
+            if value is None:
+                value = self._locals[key] = factory()
+            return value
+
+
+_tenants: Dict[str, Tenant] = {}
+_open_tenants: "OrderedDict[str, Tenant]" = OrderedDict()
+_tenants_lock = threading.Lock()
+_current_tenant: ContextVar[Optional[Tenant]] = ContextVar("alarm_tenant", default=None)
+
+
+def _touch(tenant: Tenant):
+    evicted = []
+    with _tenants_lock:
+        _open_tenants[tenant.name] = tenant
+        _open_tenants.move_to_end(tenant.name)
+        while len(_open_tenants) > max(1, settings.max_open_tenants):
+            evicted.append(_open_tenants.popitem(last=False)[1])
+    # Sessions already holding a connection finish on it; the pool is just not reused.
+    for old in evicted:
+        old.close()
+
+
+def tenant_names() -> List[str]:
+    extra = [name.strip() for name in settings.tenants.split(",") if name.strip()]
+    return [DEFAULT_TENANT, *(name for name in dict.fromkeys(extra) if name != DEFAULT_TENANT)]
+
+
+def is_known_tenant(name: str) -> bool:
+    return name == DEFAULT_TENANT or (bool(TENANT_NAME.match(name)) and name in tenant_names())
+
+
+def tenant_shard(name: str) -> int:
+    return zlib.crc32(name.encode()) % max(1, settings.tenant_shards)
+
+
+def engine_tenants() -> List[str]:
+    # Tenants whose game engine this process may run; ALARM_TENANT_SHARD picks the slice.
+    return [name for name in tenant_names() if tenant_shard(name) == settings.tenant_shard]
+
+
+def get_tenant(name: str) -> Tenant:
+    tenant = _tenants.get(name)
+    if tenant is not None:
+        return tenant
+    if not is_known_tenant(name):
+        raise KeyError(f"unknown tenant {name!r}")
+    url = settings.database_url if name == DEFAULT_TENANT else settings.tenant_database_url.format(tenant=name)
+    with _tenants_lock:
+        return _tenants.setdefault(name, Tenant(name, url))
+
+
+def open_tenants() -> List[Tenant]:
+    with _tenants_lock:
+        return [tenant for tenant in _tenants.values() if tenant.is_open]
+
+
+def current_tenant() -> Tenant:
+    return _current_tenant.get() or get_tenant(DEFAULT_TENANT)
+
+
+@contextmanager
+def use_tenant(name: str):
+    token = _current_tenant.set(get_tenant(name))
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+
+def set_tenant(name: str):
+    # For middleware; returns the token to hand back to reset_tenant().
+    return _current_tenant.set(get_tenant(name))
+
+
+def reset_tenant(token):
+    _current_tenant.reset(token)
+
+
+@contextmanager
+def use_database(url: str):
+    # Runs the block against a throwaway world on another database (e.g. an in-memory
+    # one for the headless simulation); the configured tenants are left alone.
+    tenant = Tenant(f"database:{url}", url, pinned=True)
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant.engine
+    finally:
+        _current_tenant.reset(token)
+        tenant.close()
+
+
+def init_db(attempts: int = 5):
+    _create_schema(current_tenant().engine, attempts)
+
+
+def _create_schema(engine: Engine, attempts: int = 5):
+    for attempt in range(attempts):
+        try:
+            SQLModel.metadata.create_all(engine)
+            _migrate(engine)
+            _ensure_version_rows(engine)
+            return
+        except OperationalError:
+            # Another worker starting at the same moment may have created the table
+            # between our existence check and CREATE; back off and let it finish.
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.2 * (attempt + 1))
+
+
+def _ensure_version_rows(engine: Engine):
+    with engine.begin() as conn:
+        existing = set(conn.execute(select(TableVersion.name)).scalars())
+        missing = [name for name in [*SQLModel.metadata.tables, *PSEUDO_TABLES] if name not in existing]
+        if missing:
+            conn.execute(insert(TableVersion), [{"name": name, "version": 0} for name in missing])
+
+
+def _migrate(engine: Engine):
+    # create_all() never alters existing tables, so bring older game.db files up to date.
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" DEFAULT {column.default.arg!r}"
+                conn.execute(text(ddl))
+    declared = {index.name for table in SQLModel.metadata.sorted_tables for index in table.indexes}
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            for index in inspector.get_indexes(table.name):
+                # Only our own generated/declared names; never touch indexes added by hand.
+                if index["name"].startswith("ix_") and index["name"] not in declared:
+                    conn.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+_FULL_SCAN = re.compile(r"^SCAN \w+$|Seq Scan on ")
+
+
+def explain_query_plan(session, statement) -> List[str]:
+    bind = session.get_bind()
+    compiled = statement.compile(bind, compile_kwargs={"render_postcompile": True})
+    prefix = "EXPLAIN QUERY PLAN" if bind.dialect.name == "sqlite" else "EXPLAIN"
+    # Parameter values do not change the plan shape, so placeholders are bound to NULL.
+    if compiled.positiontup is not None:
+        params = (None,) * len(compiled.positiontup)
+    else:
+        params = {name: None for name in compiled.params}
+    rows = session.connection().exec_driver_sql(f"{prefix} {compiled.string}", params).all()
+    return [row[-1] for row in rows]
+
+
+def is_full_scan(plan: List[str]) -> bool:
+    return any(_FULL_SCAN.search(step) for step in plan)
+
+
+def _changed_tables(session) -> set:
+    return session.info.setdefault("changed_tables", set())
+
+
+@event.listens_for(Session, "before_flush")
+def _track_flush(session, flush_context, instances):
+    changed = _changed_tables(session)
+    for obj in session.new | session.deleted:
+        changed.add(obj.__tablename__)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            changed.add(obj.__tablename__)
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_row_versions(session, flush_context, instances):
+    # Rows with a version column count their own updates; bulk UPDATEs set it themselves.
+    for obj in session.dirty:
+        if "version" in obj.__table__.c and session.is_modified(obj):
+            obj.version = (obj.version or 0) + 1
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _changed_tables(orm_execute_state.session).add(table.name)
+
+
+@event.listens_for(Session, "before_commit")
+def _persist_versions(session):
+    # Flush first so the final flush's tables are known, then bump their shared
+    # counters inside the same transaction. Core statements skip the ORM hooks above.
+    session.flush()
+    changed = session.info.get("changed_tables")
+    if not changed:
+        return
+    conn = session.connection()
+    conn.execute(
+        update(TableVersion).where(TableVersion.name.in_(changed)).values(version=TableVersion.version + 1)
+    )
+    rows = conn.execute(select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_(changed)))
+    session.info["shared_versions"] = dict(rows.all())
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_versions(session):
+    changed = session.info.pop("changed_tables", set())
+    shared = session.info.pop("shared_versions", {})
+    # What this commit set the shared counters to, for callers that track them.
+    session.info["written_versions"] = shared
+    versions = session.info.get("tenant", current_tenant()).versions
+    versions.observe(shared, PSEUDO_TABLES)
+    # Tables without a version row (a database init_db() never ran on) still invalidate locally.
+    unversioned = changed - shared.keys()
+    versions.bump(unversioned, world=bool(unversioned - set(PSEUDO_TABLES)))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("changed_tables", None)
+    session.info.pop("shared_versions", None)
+
+
+def mark_changed(session, names):
+    # Counts `names` as written when `session` commits, e.g. the "reset" pseudo-table.
+    _changed_tables(session).update(names)
+
+
+def begin_write(session):
+    # SQLite only starts the transaction at the first write, so the reads before it
+    # could see a world another process replaced meanwhile (a restore, a reset). Taking
+    # the write lock up front makes the whole unit of work one transaction.
+    conn = session.connection()
+    if conn.dialect.name != "sqlite" or _is_memory_sqlite(conn.engine.url):
+        return
+    if not conn.connection.driver_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def begin_read(session):
+    # Makes the session's following SELECTs read one consistent snapshot of the database.
+    if session.get_bind().dialect.name != "sqlite":
+        session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        return
+    conn = session.connection()
+    if not _is_memory_sqlite(conn.engine.url) and not conn.connection.driver_connection.in_transaction:
+        conn.exec_driver_sql("BEGIN")
+
+
+def touch_tables(names):
+    # Marks tables as changed without writing to them, e.g. "clock" after a tick.
+    with get_session() as session:
+        mark_changed(session, names)
+        session.connection()
+        session.commit()
+
+
+def sync_versions(session=None) -> Dict[str, int]:
+    # Picks up commits made by other processes (web workers vs. the engine leader);
+    # given a session, reads the counters inside its transaction. Returns what it read.
+    return current_tenant().sync(session)
 
 
 @contextmanager
 def get_session():
-    with Session(engine) as session:
+    tenant = current_tenant()
+    with Session(tenant.engine, info={"tenant": tenant}) as session:
         yield session
 
+
+@contextmanager
+def get_read_session():
+    tenant = current_tenant()
+    with Session(tenant.read_engine, info={"tenant": tenant}) as session:
+        yield session
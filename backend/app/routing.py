@@ -0,0 +1,172 @@
+import heapq
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlmodel import delete, select
+
+from .models import RoadCell
+from .repo import current_tenant, get_read_session, get_session
+
+INFINITY = float("inf")
+
+
+class Router:
+    # Shortest drive distances over the grid. Entering a cell costs its weight (1 = open
+    # road, so an unweighted map gives exactly the Manhattan distance); blocked cells have
+    # infinite weight. Each source cell gets one row of distances to every cell, built by
+    # Dijkstra on first use; after that a query is a list lookup. Units leave from a
+    # handful of stations, so only those rows are ever built.
+
+    def __init__(self, size: int):
+        self.width = size + 1
+        cells = self.width * self.width
+        self.weights: List[float] = [1.0] * cells
+        self._neighbours = [self._adjacent(cell) for cell in range(cells)]
+        self._rows: Dict[int, List[float]] = {}
+        self._lock = threading.Lock()
+        # Bumped by every weight change, so a row built meanwhile is not kept.
+        self._generation = 0
+        self.version: Optional[int] = None
+        self.builds = 0
+        self.patched = 0
+        self.dropped = 0
+
+    def _adjacent(self, cell: int) -> Tuple[int, ...]:
+        x, y = cell % self.width, cell // self.width
+        steps = ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+        return tuple(ny * self.width + nx for nx, ny in steps if 0 <= nx < self.width and 0 <= ny < self.width)
+
+    def _cell(self, x: int, y: int) -> Optional[int]:
+        if 0 <= x < self.width and 0 <= y < self.width:
+            return y * self.width + x
+        return None
+
+    def distance(self, from_x: int, from_y: int, to_x: int, to_y: int) -> float:
+        source, target = self._cell(from_x, from_y), self._cell(to_x, to_y)
+        if source is None or target is None:
+            # Off the map there are no roads to weigh; drive straight.
+            return abs(from_x - to_x) + abs(from_y - to_y)
+        row = self._rows.get(source)
+        if row is None:
+            row = self._build(source)
+        return row[target]
+
+    def return_distance(self, from_x: int, from_y: int, to_x: int, to_y: int) -> float:
+        # The drive from (from) back to (to), read off the row rooted at (to): a reversed
+        # path pays for the cell it leaves instead of the one it reaches, so the way back
+        # costs the cheapest way out to a neighbour of (from) plus the weight of (to).
+        # Return trips thus reuse the rows of the cells units leave from instead of
+        # building one per incident cell.
+        scene, home = self._cell(from_x, from_y), self._cell(to_x, to_y)
+        if scene is None or home is None:
+            return abs(from_x - to_x) + abs(from_y - to_y)
+        if scene == home:
+            return 0.0
+        row = self._rows.get(home)
+        if row is None:
+            row = self._build(home)
+        return min(row[cell] for cell in self._neighbours[scene]) + self.weights[home]
+
+    def _build(self, source: int) -> List[float]:
+        with self._lock:
+            generation = self._generation
+            weights = list(self.weights)
+        neighbours = self._neighbours
+        row = [INFINITY] * len(weights)
+        row[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            reached, cell = heapq.heappop(heap)
+            if reached > row[cell]:
+                continue
+            for nxt in neighbours[cell]:
+                candidate = reached + weights[nxt]
+                if candidate < row[nxt]:
+                    row[nxt] = candidate
+                    heapq.heappush(heap, (candidate, nxt))
+        with self._lock:
+            self.builds += 1
+            if generation == self._generation:
+                self._rows[source] = row
+        return row
+
+    def set_weight(self, x: int, y: int, weight: float):
+        cell = self._cell(x, y)
+        if cell is None:
+            return
+        with self._lock:
+            if self.weights[cell] == weight:
+                return
+            self.weights[cell] = weight
+            self._generation += 1
+            self._update_rows(cell, weight)
+
+    def _update_rows(self, cell: int, weight: float):
+        # Only rows with a shortest path running on through the cell (or that would after
+        # the change) are dropped and rebuilt on next use; in every other row just the
+        # distance to the cell itself moves.
+        neighbours, weights = self._neighbours[cell], self.weights
+        for source, row in list(self._rows.items()):
+            if source == cell:
+                continue  # leaving a cell does not pay for it
+            before = row[cell]
+            after = min(row[n] for n in neighbours) + weight
+            if after < before:
+                through = any(after + weights[n] < row[n] for n in neighbours)
+            else:
+                through = before != INFINITY and any(before + weights[n] == row[n] for n in neighbours)
+            if through:
+                del self._rows[source]
+                self.dropped += 1
+            else:
+                row[cell] = after
+                self.patched += 1
+
+    def sync(self, version: int, cells: Dict[Tuple[int, int], float]):
+        # Applies the stored map as a diff against the weights already in use.
+        with self._lock:
+            current = {
+                (cell % self.width, cell // self.width): weight
+                for cell, weight in enumerate(self.weights)
+                if weight != 1.0
+            }
+        for xy in current.keys() - cells.keys():
+            self.set_weight(*xy, 1.0)
+        for xy, weight in cells.items():
+            if current.get(xy) != weight:
+                self.set_weight(*xy, weight)
+        self.version = version
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self._rows),
+            "builds": self.builds,
+            "patched": self.patched,
+            "dropped": self.dropped,
+            "weighted_cells": sum(1 for weight in self.weights if weight != 1.0),
+        }
+
+
+def _load_road_map() -> Dict[Tuple[int, int], float]:
+    with get_read_session() as s:
+        return {(cell.x, cell.y): INFINITY if cell.blocked else cell.cost for cell in s.exec(select(RoadCell))}
+
+
+def road_router(grid_size: int) -> Router:
+    tenant = current_tenant()
+    router = tenant.local("road_router", lambda: Router(grid_size))
+    version = tenant.versions.get("roadcell")
+    if router.version != version:
+        # Read the version first: an edit during the load just means one more sync.
+        router.sync(version, _load_road_map())
+    return router
+
+
+def set_road(x: int, y: int, cost: float = 1.0, blocked: bool = False):
+    if cost <= 0:
+        raise ValueError("road cost must be positive")
+    with get_session() as s:
+        s.exec(delete(RoadCell).where(RoadCell.x == x, RoadCell.y == y))
+        if blocked or cost != 1.0:
+            s.add(RoadCell(x=x, y=y, cost=cost, blocked=blocked))
+        s.commit()
@@ -1,3 +1,7 @@
+import random
+from datetime import timedelta
+
+from sqlalchemy import insert
 from sqlmodel import delete
 
 from .models import (
@@ -8,16 +12,34 @@ from .models import (
     Personnel,
     Incident,
     Dispatch,
+    DispatchArchive,
+    IncidentArchive,
+    RoadCell,
 )
-from .repo import get_session
+from .clock import utcnow
+from .eventlog import record
+from .repo import get_session, mark_changed
+from .services import BASE_GRID_SIZE, CITIES_FALLBACK, INCIDENT_TYPES, engine_lock
+
+CREW_ROLES = {
+    "fire": ["driver", "firefighter", "firefighter"],
+    "ambulance": ["driver", "paramedic"],
+    "police": ["driver"],
+}
+
+
+def _clear(s):
+    # The event log is append-only: replay starts over at each world_seeded event and
+    # tail readers keep their position, so it is never cleared.
+    for model in [DispatchArchive, IncidentArchive, Dispatch, Incident, Personnel, Unit, Hospital, Station, GameState, RoadCell]:
+        s.exec(delete(model))
 
 
 def seed():
-    with get_session() as s:
-        # Clean the slate so seed can be rerun safely
-        for model in [Dispatch, Incident, Personnel, Unit, Hospital, Station, GameState]:
-            s.exec(delete(model))
-        s.commit()
+    with engine_lock(), get_session() as s:
+        # Clean the slate so seed can be rerun safely; clearing and refilling is one
+        # transaction, so no reader or tick ever sees the empty world in between.
+        _clear(s)
 
         stations = [
             Station(name="Station Randers", city="Randers", grid_x=3, grid_y=4),
@@ -95,6 +117,108 @@ def seed():
 
         gamestate = GameState(funds=2000, xp=0)
 
-        for entry in stations + hospitals + units + personnel + [gamestate]:
-            s.add(entry)
+        s.add_all(stations + hospitals + units + personnel + [gamestate])
+        # Replays start from this snapshot of the fresh world.
+        record(s, "world_seeded", utcnow(), station=stations, hospital=hospitals, unit=units, personnel=personnel, gamestate=gamestate)
+        # Ids and row versions start over; anything cached per (id, version) is stale.
+        mark_changed(s, ("reset",))
+        s.commit()
+
+
+def seed_synthetic(stations: int, units: int, incidents: int, personnel: int, hospitals: int = 0, seed: int = 0):
+    # Benchmark-sized world: same shape as seed(), scaled up and bulk-inserted.
+    # Ids are assigned here so rows can reference each other without round trips.
+    rand = random.Random(seed)
+    now = utcnow()
+    hospitals = hospitals or max(1, stations // 2)
+    cities = [CITIES_FALLBACK[i % len(CITIES_FALLBACK)] + ("" if i < len(CITIES_FALLBACK) else f" {i}") for i in range(max(1, stations // 4))]
+
+    def cell():
+        return rand.randint(0, BASE_GRID_SIZE), rand.randint(0, BASE_GRID_SIZE)
+
+    station_rows = []
+    for i in range(1, stations + 1):
+        x, y = cell()
+        station_rows.append({"id": i, "name": f"Station {i}", "city": cities[i % len(cities)], "grid_x": x, "grid_y": y})
+    hospital_rows = []
+    for i in range(1, hospitals + 1):
+        x, y = cell()
+        hospital_rows.append(
+            {"id": i, "name": f"Hospital {i}", "city": cities[i % len(cities)], "capacity": 40, "occupied": 0, "grid_x": x, "grid_y": y}
+        )
+    unit_rows = []
+    for i in range(1, units + 1):
+        station = station_rows[i % len(station_rows)]
+        kind = rand.choice(["fire", "fire", "ambulance", "ambulance", "police"])
+        unit_rows.append(
+            {
+                "id": i,
+                "kind": kind,
+                "name": f"{kind[:3].upper()}-{i}",
+                "status": "available",
+                "station_id": station["id"],
+                "speed": round(rand.uniform(1.0, 1.6), 2),
+                "condition": 1.0,
+                "location_x": station["grid_x"],
+                "location_y": station["grid_y"],
+                "home_x": station["grid_x"],
+                "home_y": station["grid_y"],
+            }
+        )
+    personnel_rows = []
+    for i in range(1, personnel + 1):
+        unit = unit_rows[(i - 1) % len(unit_rows)] if unit_rows else None
+        roles = CREW_ROLES[unit["kind"]] if unit else ["driver"]
+        personnel_rows.append(
+            {
+                "id": i,
+                "name": f"Crew {i}",
+                "role": roles[((i - 1) // max(1, len(unit_rows))) % len(roles)],
+                "skill": rand.randint(1, 3),
+                "fatigue": 0.0,
+                "on_shift": True,
+                "unit_id": unit["id"] if unit else None,
+            }
+        )
+    incident_rows = []
+    for i in range(1, incidents + 1):
+        typ, req = rand.choice(INCIDENT_TYPES)
+        x, y = cell()
+        severity = rand.randint(1, 5)
+        deadline_s = rand.choice([240, 300, 360])
+        created_at = now - timedelta(seconds=rand.randint(0, deadline_s - 1))
+        incident_rows.append(
+            {
+                "id": i,
+                "type": typ,
+                "severity": severity,
+                "city": rand.choice(cities),
+                "status": "new",
+                "need_fire": rand.randint(*req["fire"]),
+                "need_ambulance": rand.randint(*req["ambulance"]),
+                "created_at": created_at,
+                "deadline_s": deadline_s,
+                "due_at": created_at + timedelta(seconds=deadline_s),
+                "grid_x": x,
+                "grid_y": y,
+                "xp_reward": severity * 8,
+                "cash_reward": severity * 150,
+            }
+        )
+
+    with engine_lock(), get_session() as s:
+        _clear(s)
+        for model, rows in [
+            (Station, station_rows),
+            (Hospital, hospital_rows),
+            (Unit, unit_rows),
+            (Personnel, personnel_rows),
+            (Incident, incident_rows),
+        ]:
+            if rows:
+                s.execute(insert(model), rows)
+        s.add(GameState(funds=2000, xp=0))
+        # Too many rows to snapshot into the log; the marker still starts replay over.
+        record(s, "world_seeded", now)
+        mark_changed(s, ("reset",))
         s.commit()
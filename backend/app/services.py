@@ -1,11 +1,22 @@
-import random
+import threading
 from datetime import datetime, timedelta
-from typing import Dict, Iterable, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
+from sqlalchemy import func, update
 from sqlmodel import select
 
-from .models import GameState, Hospital, Station, Unit, Incident, Dispatch, Personnel
-from .repo import get_session
+from .clock import rng, utcnow
+from .eventlog import record, unit_event_kind
+from .metrics import incidents_spawned, tick_dispatches, timed
+from .models import GameState, Hospital, Unit, Incident, Dispatch, Personnel
+from .repo import begin_write, current_tenant, explain_query_plan, get_read_session, get_session, is_full_scan
+from .routing import INFINITY, road_router
+from .spatial import CityAnchors, city_anchors, hospital_index
+
+try:
+    import numpy as np
+except ImportError:  # optional: the crew step falls back to a plain loop
+    np = None
 
 CITIES_FALLBACK = ["Randers", "Aarhus", "Viborg", "Silkeborg", "Aalborg"]
 
@@ -14,30 +25,34 @@ INCIDENT_TYPES = [
     ("medical", {"fire": (0, 1), "ambulance": (1, 2)}),
     ("traffic", {"fire": (0, 1), "ambulance": (1, 2)}),
 ]
+INCIDENT_REQUIREMENTS = dict(INCIDENT_TYPES)
 
 BASE_GRID_SIZE = 12
 MIN_TRAVEL_TIME = 45
 RESOLVE_TICK_BASE = 90
 RETURN_BUFFER = 20
+RESOLVE_SEVERITY_S = 40
 
+TICK_INTERVAL_S = 10
+SPAWN_INTERVAL_S = 45
 
-def random_city(session):
-    cities = [s.city for s in session.exec(select(Station)).all()] or CITIES_FALLBACK
-    return random.choice(cities)
+OPEN_STATUSES = ("new", "responding", "resolving")
+BUSY_UNIT_STATUSES = ("enroute", "at_scene", "returning")
 
+FATIGUE_REST_AT = 95
+FATIGUE_ON_SHIFT_BELOW = 70
+REST_HOURS = 2
 
-def grid_bounds(value: int) -> int:
-    return max(0, min(BASE_GRID_SIZE, value))
 
+def engine_lock():
+    # Serialises engine writes to one world within this process; other tenants' ticks,
+    # seeds and bursts never wait on it. The in-memory engine (world.py) relies on it
+    # so no spawn or dispatch lands between its tick and its write-back.
+    return current_tenant().local("engine_lock", threading.RLock)
 
-def city_anchor(session, city: str):
-    station = session.exec(select(Station).where(Station.city == city)).first()
-    if station:
-        return station.grid_x, station.grid_y
-    hospital = session.exec(select(Hospital).where(Hospital.city == city)).first()
-    if hospital:
-        return hospital.grid_x, hospital.grid_y
-    return random.randint(0, BASE_GRID_SIZE), random.randint(0, BASE_GRID_SIZE)
+
+def grid_bounds(value: int) -> int:
+    return max(0, min(BASE_GRID_SIZE, value))
 
 
 def ensure_gamestate(session) -> GameState:
@@ -54,232 +69,505 @@ def unit_personnel(session, unit_id: int) -> List[Personnel]:
     return session.exec(select(Personnel).where(Personnel.unit_id == unit_id)).all()
 
 
-def fatigue_tick(personnel: Iterable[Personnel], delta: float):
-    for member in personnel:
-        member.fatigue = max(0.0, min(100.0, member.fatigue + delta))
-        if member.fatigue >= 95 and not member.rest_until:
-            member.rest_until = datetime.utcnow() + timedelta(hours=2)
-            member.on_shift = False
+def _crew_step_loop(crew, draws: List[float], now: datetime):
+    rest_end = now + timedelta(hours=REST_HOURS)
+    result = []
+    for (_, fatigue, rest_until, on_shift, unit_status, _), draw in zip(crew, draws):
+        if rest_until and rest_until <= now:
+            rest_until = None
+            fatigue = max(10.0, fatigue - 20)
+        busy = unit_status in BUSY_UNIT_STATUSES
+        # Same arithmetic as rng.uniform(3, 6) / -rng.uniform(1, 3) on the same draw.
+        delta = 3 + 3 * draw if busy else -(1 + 2 * draw)
+        fatigue = max(0.0, min(100.0, fatigue + delta))
+        if fatigue >= FATIGUE_REST_AT and not rest_until:
+            rest_until = rest_end
+            on_shift = False
+        if not busy and fatigue < FATIGUE_ON_SHIFT_BELOW:
+            on_shift = True
+        result.append((fatigue, rest_until, on_shift))
+    return result
+
+
+def _crew_step_numpy(crew, draws: List[float], now: datetime):
+    rest_end = now + timedelta(hours=REST_HOURS)
+    fatigue = np.array([row[1] for row in crew], dtype=np.float64)
+    resting = np.array([row[2] is not None for row in crew], dtype=bool)
+    rest_over = np.array([row[2] is not None and row[2] <= now for row in crew], dtype=bool)
+    on_shift = np.array([bool(row[3]) for row in crew], dtype=bool)
+    busy = np.array([row[4] in BUSY_UNIT_STATUSES for row in crew], dtype=bool)
+    draw = np.array(draws, dtype=np.float64)
+
+    fatigue = np.where(rest_over, np.maximum(10.0, fatigue - 20), fatigue)
+    resting &= ~rest_over
+    fatigue = np.clip(fatigue + np.where(busy, 3 + 3 * draw, -(1 + 2 * draw)), 0.0, 100.0)
+    start_rest = (fatigue >= FATIGUE_REST_AT) & ~resting
+    on_shift = (on_shift & ~start_rest) | (~busy & (fatigue < FATIGUE_ON_SHIFT_BELOW))
+    return [
+        (level, rest_end if started else (row[2] if still else None), shift)
+        for row, level, started, still, shift in zip(
+            crew, fatigue.tolist(), start_rest.tolist(), resting.tolist(), on_shift.tolist()
+        )
+    ]
+
+
+def crew_step(crew, now: datetime) -> List[dict]:
+    # One batched pass over (id, fatigue, rest_until, on_shift, unit status, version) rows in id
+    # order: rest expiry, fatigue drift, FATIGUE_REST_AT -> rest, below
+    # FATIGUE_ON_SHIFT_BELOW -> back on shift. One random draw per member, in the order
+    # the per-member loop drew them. Returns only the rows that changed.
+    crew = list(crew)
+    draws = [rng.random() for _ in crew]
+    step = _crew_step_numpy if np is not None else _crew_step_loop
+    changes = []
+    for row, (fatigue, rest_until, on_shift) in zip(crew, step(crew, draws, now)):
+        if (fatigue, rest_until, on_shift) != (row[1], row[2], row[3]):
+            changes.append(
+                {"id": row[0], "fatigue": fatigue, "rest_until": rest_until, "on_shift": on_shift, "version": row[5] + 1}
+            )
+    return changes
+
+
+def _new_incident(
+    anchors: CityAnchors,
+    now: datetime,
+    kinds: Optional[Sequence[str]] = None,
+    city: Optional[str] = None,
+    origin: Optional[Tuple[int, int]] = None,
+    spread: int = 3,
+    severity: Tuple[int, int] = (1, 5),
+) -> Incident:
+    # The defaults draw from rng in the same order spawn_incident() always has, so
+    # seeded simulations keep producing the same incidents.
+    if kinds:
+        typ = rng.choice(kinds)
+        req = INCIDENT_REQUIREMENTS[typ]
+    else:
+        typ, req = rng.choice(INCIDENT_TYPES)
+    if city is None:
+        city = rng.choice(anchors.cities or CITIES_FALLBACK)
+    if origin is None:
+        origin = anchors.anchors.get(city) or (rng.randint(0, BASE_GRID_SIZE), rng.randint(0, BASE_GRID_SIZE))
+    x = grid_bounds(origin[0] + rng.randint(-spread, spread))
+    y = grid_bounds(origin[1] + rng.randint(-spread, spread))
+    level = rng.randint(*severity)
+    inc = Incident(
+        type=typ,
+        severity=level,
+        city=city,
+        need_fire=rng.randint(*req["fire"]),
+        need_ambulance=rng.randint(*req["ambulance"]),
+        created_at=now,
+        deadline_s=rng.choice([240, 300, 360]),
+        grid_x=x,
+        grid_y=y,
+        xp_reward=level * 8 + rng.randint(0, 6),
+        cash_reward=level * 150 + rng.randint(0, 100),
+    )
+    inc.due_at = now + timedelta(seconds=inc.deadline_s)
+    return inc
+
+
+@timed()
+def spawn_incidents(count: int, source: str = "scheduled", **options) -> List[int]:
+    # Builds `count` incidents and inserts them in one transaction (one batched INSERT);
+    # `options` go to _new_incident(). Returns the new ids.
+    if count <= 0:
+        return []
+    with engine_lock(), get_session() as s:
+        now = utcnow()
+        anchors = city_anchors()
+        incidents = [_new_incident(anchors, now, **options) for _ in range(count)]
+        s.add_all(incidents)
+        s.flush()
+        for inc in incidents:
+            record(s, "incident_spawned", now, incident=inc)
+        ids = [inc.id for inc in incidents]
+        s.commit()
+    incidents_spawned.inc(count, source=source)
+    return ids
 
 
+@timed()
 def spawn_incident():
-    with get_session() as s:
-        typ, req = random.choice(INCIDENT_TYPES)
-        city = random_city(s)
-        anchor_x, anchor_y = city_anchor(s, city)
-        x = grid_bounds(anchor_x + random.randint(-3, 3))
-        y = grid_bounds(anchor_y + random.randint(-3, 3))
-        severity = random.randint(1, 5)
-        inc = Incident(
-            type=typ,
-            severity=severity,
-            city=city,
-            need_fire=random.randint(*req["fire"]),
-            need_ambulance=random.randint(*req["ambulance"]),
-            deadline_s=random.choice([240, 300, 360]),
-            grid_x=x,
-            grid_y=y,
-            xp_reward=severity * 8 + random.randint(0, 6),
-            cash_reward=severity * 150 + random.randint(0, 100),
-        )
+    with engine_lock(), get_session() as s:
+        now = utcnow()
+        inc = _new_incident(city_anchors(), now)
         s.add(inc)
+        record(s, "incident_spawned", now, incident=inc)
         s.commit()
         s.refresh(inc)
-        return inc
+    incidents_spawned.inc(source="scheduled")
+    return inc
+
+
+def crew_ready(unit: Unit, crew: List[Personnel], now: datetime) -> bool:
+    if unit.status != "available" or (unit.down_until and unit.down_until > now):
+        return False
+    if not crew:
+        return False
+
+    required_roles = {"driver"}
+    if unit.kind == "fire":
+        required_roles.add("firefighter")
+    if unit.kind == "ambulance":
+        required_roles.add("paramedic")
+
+    available_roles = {member.role for member in crew if member.fatigue < 98 and not member.rest_until}
+    return required_roles.issubset(available_roles)
+
+
+def _drive_time_s(speed: float, distance: float) -> Optional[int]:
+    # Drive time along the road map (routing.py); None when blocked roads cut it off.
+    if distance == INFINITY:
+        return None
+    return int(max(MIN_TRAVEL_TIME, (distance / max(speed, 0.5)) * 40))
+
+
+def travel_time_s(unit: Unit, x: int, y: int) -> Optional[int]:
+    distance = road_router(BASE_GRID_SIZE).distance(unit.location_x, unit.location_y, x, y)
+    return _drive_time_s(unit.speed, distance)
 
 
+def return_time_s(unit: Unit, x: int, y: int) -> Optional[int]:
+    # Home from (x, y); weighted roads make it differ from the way out.
+    distance = road_router(BASE_GRID_SIZE).return_distance(x, y, unit.home_x, unit.home_y)
+    return _drive_time_s(unit.speed, distance)
+
+
+def assign_unit(
+    session, inc: Incident, unit: Unit, crew: List[Personnel], now: datetime, travel_time: int
+) -> Dispatch:
+    arrive_at = now + timedelta(seconds=travel_time)
+
+    unit.status = "enroute"
+    unit.down_until = None
+    unit.condition = max(0.1, unit.condition - rng.uniform(0.02, 0.08))
+
+    for member in crew:
+        member.on_shift = True
+        member.rest_until = None
+        member.fatigue = min(100.0, member.fatigue + rng.uniform(2, 5))
+
+    dispatch = Dispatch(
+        incident_id=inc.id,
+        unit_id=unit.id,
+        assigned_at=now,
+        arrive_at=arrive_at,
+        travel_time_s=travel_time,
+        due_at=arrive_at,
+    )
+    session.add(dispatch)
+    if inc.status == "new":
+        inc.status = "responding"
+        inc.response_started_at = now
+    record(session, "unit_dispatched", now, unit=unit, incident=inc, dispatch=dispatch)
+    return dispatch
+
+
+@timed()
 def dispatch_unit(incident_id: int, unit_id: int) -> bool:
-    with get_session() as s:
+    with engine_lock(), get_session() as s:
+        # Lock before reading, so no other process can hand out the same unit meanwhile.
+        begin_write(s)
         inc = s.get(Incident, incident_id)
         unit = s.get(Unit, unit_id)
         if not inc or not unit:
             return False
         if inc.status in {"resolved", "failed"}:
             return False
-        if unit.status != "available" or (unit.down_until and unit.down_until > datetime.utcnow()):
-            return False
 
+        now = utcnow()
         crew = unit_personnel(s, unit.id)
-        if not crew:
+        if not crew_ready(unit, crew, now):
             return False
-
-        required_roles = {"driver"}
-        if unit.kind == "fire":
-            required_roles.add("firefighter")
-        if unit.kind == "ambulance":
-            required_roles.add("paramedic")
-
-        available_roles = {member.role for member in crew if member.fatigue < 98 and not member.rest_until}
-        if not required_roles.issubset(available_roles):
+        travel_time = travel_time_s(unit, inc.grid_x, inc.grid_y)
+        if travel_time is None:
             return False
 
-        now = datetime.utcnow()
-        distance = abs(unit.location_x - inc.grid_x) + abs(unit.location_y - inc.grid_y)
-        travel_time = int(max(MIN_TRAVEL_TIME, (distance / max(unit.speed, 0.5)) * 40))
-        arrive_at = now + timedelta(seconds=travel_time)
-
-        unit.status = "enroute"
-        unit.down_until = None
-        unit.condition = max(0.1, unit.condition - random.uniform(0.02, 0.08))
-
-        for member in crew:
-            member.on_shift = True
-            member.rest_until = None
-            member.fatigue = min(100.0, member.fatigue + random.uniform(2, 5))
-            s.add(member)
-
-        dispatch = Dispatch(
-            incident_id=inc.id,
-            unit_id=unit.id,
-            arrive_at=arrive_at,
-            travel_time_s=travel_time,
-        )
-
-        s.add(dispatch)
-        if inc.status == "new":
-            inc.status = "responding"
-            inc.response_started_at = now
-        s.add(unit)
-        s.add(inc)
+        assign_unit(s, inc, unit, crew, now, travel_time)
         s.commit()
         return True
 
 
-def _resolve_requirements(session, inc: Incident) -> Dict[str, int]:
-    dispatched = session.exec(select(Dispatch).where(Dispatch.incident_id == inc.id, Dispatch.active)).all()
-    counts = {"fire": 0, "ambulance": 0, "other": 0}
-    for di in dispatched:
-        unit = session.get(Unit, di.unit_id)
-        if not unit:
-            continue
-        if unit.status not in {"enroute", "at_scene"}:
-            continue
-        if unit.kind == "fire":
-            counts["fire"] += 1
-        elif unit.kind == "ambulance":
-            counts["ambulance"] += 1
-        else:
-            counts["other"] += 1
+def _requirements_query():
+    return (
+        select(Dispatch.incident_id, Unit.kind, func.count())
+        .join(Unit, Unit.id == Dispatch.unit_id)
+        .join(Incident, Incident.id == Dispatch.incident_id)
+        .where(
+            Dispatch.active,
+            Unit.status.in_(["enroute", "at_scene"]),
+            Incident.status.in_(["new", "responding"]),
+        )
+        .group_by(Dispatch.incident_id, Unit.kind)
+    )
+
+
+def requirement_counts(session) -> Dict[int, Dict[str, int]]:
+    # One grouped query over live dispatches instead of a lookup per incident and unit.
+    counts: Dict[int, Dict[str, int]] = {}
+    for incident_id, kind, count in session.exec(_requirements_query()).all():
+        entry = counts.setdefault(incident_id, {"fire": 0, "ambulance": 0, "other": 0})
+        entry[kind if kind in ("fire", "ambulance") else "other"] += count
     return counts
 
 
 def _nearest_hospital(session, inc: Incident) -> Optional[Hospital]:
-    hospitals = session.exec(select(Hospital)).all()
-    if not hospitals:
+    nearest = hospital_index().nearest(inc.grid_x, inc.grid_y)
+    if not nearest:
         return None
-    hospitals.sort(key=lambda h: abs(h.grid_x - inc.grid_x) + abs(h.grid_y - inc.grid_y))
-    return hospitals[0]
+    return session.get(Hospital, nearest[0][1].id)
 
 
-def tick():
-    now = datetime.utcnow()
+def _by_id(session, model, ids) -> dict:
+    ids = set(ids)
+    if not ids:
+        return {}
+    return {row.id: row for row in session.exec(select(model).where(model.id.in_(ids)))}
+
+
+def _in_id_order(rows) -> list:
+    # Ticks visit rows in id order in both engines. Sorted here rather than with ORDER BY
+    # id, which tempts SQLite into a rowid scan.
+    return sorted(rows, key=lambda row: row.id)
+
+
+def _down_units_query(now: datetime):
+    return select(Unit).where(Unit.status.in_(["broken", "maintenance"]), Unit.down_until <= now)
+
+
+def _due_dispatches_query(now: datetime):
+    return select(Dispatch).where(Dispatch.active, Dispatch.due_at <= now)
+
+
+def _due_incidents_query(now: datetime):
+    return select(Incident).where(Incident.due_at <= now, Incident.status.in_(OPEN_STATUSES))
+
+
+def _unconditional_incidents_query():
+    return select(Incident).where(
+        Incident.status.in_(["new", "responding"]),
+        Incident.need_fire <= 0,
+        Incident.need_ambulance <= 0,
+    )
+
+
+def hot_query_plans() -> List[dict]:
+    # EXPLAIN QUERY PLAN for every filtered query on the tick/dispatch/spawn paths;
+    # a plain "SCAN <table>" step means the query fell back to a full table scan.
+    now = utcnow()
+    queries = {
+        "tick.down_units": _down_units_query(now),
+        "tick.due_dispatches": _due_dispatches_query(now),
+        "tick.requirements": _requirements_query(),
+        "tick.unconditional_incidents": _unconditional_incidents_query(),
+        "tick.due_incidents": _due_incidents_query(now),
+        "dispatch.unit_personnel": select(Personnel).where(Personnel.unit_id == 1),
+        "dispatch.incident_dispatches": select(Dispatch).where(Dispatch.active, Dispatch.incident_id == 1),
+    }
+    with get_read_session() as s:
+        plans = []
+        for name, statement in queries.items():
+            plan = explain_query_plan(s, statement)
+            plans.append({"query": name, "plan": plan, "full_scan": is_full_scan(plan)})
+        return plans
+
+
+def _resolve_time(inc: Incident) -> timedelta:
+    return timedelta(seconds=RESOLVE_TICK_BASE + inc.severity * RESOLVE_SEVERITY_S)
+
+
+def backfill_due_times():
+    # Rows written before due_at existed would otherwise never be picked up by tick().
     with get_session() as s:
-        ensure_gamestate(s)
-        for unit in s.exec(select(Unit)):
-            if unit.status == "broken" and unit.down_until and unit.down_until <= now:
-                unit.status = "maintenance"
-                unit.down_until = now + timedelta(minutes=10)
-                s.add(unit)
-            elif unit.status == "maintenance" and unit.down_until and unit.down_until <= now:
-                unit.status = "available"
-                unit.condition = min(1.0, unit.condition + 0.25)
-                unit.location_x = unit.home_x
-                unit.location_y = unit.home_y
-                unit.down_until = None
-                s.add(unit)
-
-        for dispatch in s.exec(select(Dispatch).where(Dispatch.active)):
-            unit = s.get(Unit, dispatch.unit_id)
-            inc = s.get(Incident, dispatch.incident_id)
-            if not unit or not inc:
-                dispatch.active = False
-                s.add(dispatch)
-                continue
-
-            if unit.status == "enroute" and dispatch.arrive_at and now >= dispatch.arrive_at:
-                if random.random() < 0.05 * (1.2 - unit.condition):
-                    unit.status = "broken"
-                    unit.down_until = now + timedelta(minutes=15)
-                    dispatch.active = False
-                else:
-                    unit.status = "at_scene"
-                    unit.location_x = inc.grid_x
-                    unit.location_y = inc.grid_y
-                    dispatch.arrive_at = now
-                    dispatch.return_at = now + timedelta(seconds=RESOLVE_TICK_BASE + inc.severity * 30)
-                    if inc.status == "responding":
-                        counts = _resolve_requirements(s, inc)
-                        if counts["fire"] >= inc.need_fire and counts["ambulance"] >= inc.need_ambulance:
-                            inc.status = "resolving"
-                            inc.response_started_at = now
-                s.add(unit)
-                s.add(dispatch)
-                s.add(inc)
-                continue
-
-            if unit.status == "at_scene" and dispatch.return_at and now >= dispatch.return_at:
-                unit.status = "returning"
-                dispatch.return_at = now + timedelta(seconds=max(MIN_TRAVEL_TIME, dispatch.travel_time_s) + RETURN_BUFFER)
-                s.add(unit)
-                s.add(dispatch)
-                continue
-
-            if unit.status == "returning" and dispatch.return_at and now >= dispatch.return_at:
-                unit.status = "available"
-                unit.location_x = unit.home_x
-                unit.location_y = unit.home_y
-                dispatch.active = False
-                s.add(unit)
-                s.add(dispatch)
-
-        for inc in s.exec(select(Incident).where(Incident.status.in_(["new", "responding", "resolving"]))):
-            if inc.status in {"new", "responding"}:
-                counts = _resolve_requirements(s, inc)
-                if counts["fire"] >= inc.need_fire and counts["ambulance"] >= inc.need_ambulance:
-                    inc.status = "resolving"
-                    inc.response_started_at = inc.response_started_at or now
-            if inc.status == "resolving":
-                resolve_time = RESOLVE_TICK_BASE + inc.severity * 40
-                if inc.response_started_at and (now - inc.response_started_at).total_seconds() >= resolve_time:
-                    hospital = _nearest_hospital(s, inc)
-                    ambulances_needed = inc.need_ambulance
-                    if hospital and hospital.occupied + ambulances_needed <= hospital.capacity:
-                        hospital.occupied += max(1, ambulances_needed)
-                        inc.status = "resolved"
-                        inc.resolved_at = now
-                        gs = ensure_gamestate(s)
-                        gs.funds += inc.cash_reward
-                        gs.xp += inc.xp_reward
-                        gs.incidents_resolved += 1
-                        s.add(hospital)
-                        s.add(gs)
-                    else:
-                        inc.status = "failed"
-                        inc.resolved_at = now
-                        gs = ensure_gamestate(s)
-                        gs.incidents_failed += 1
-                        gs.funds = max(0, gs.funds - int(inc.cash_reward * 0.2))
-                        s.add(gs)
-            if inc.status in {"new", "responding"}:
-                age = (now - inc.created_at).total_seconds()
-                if age > inc.deadline_s:
-                    inc.status = "failed"
-                    gs = ensure_gamestate(s)
-                    gs.incidents_failed += 1
-                    s.add(gs)
-            s.add(inc)
-
-        for member in s.exec(select(Personnel)):
-            if member.rest_until and member.rest_until <= now:
-                member.rest_until = None
-                member.fatigue = max(10.0, member.fatigue - 20)
-            unit = member.unit_id and s.get(Unit, member.unit_id)
-            if unit and unit.status in {"enroute", "at_scene", "returning"}:
-                fatigue_tick([member], random.uniform(3, 6))
+        for inc in s.exec(select(Incident).where(Incident.status.in_(OPEN_STATUSES), Incident.due_at.is_(None))):
+            if inc.status == "resolving" and inc.response_started_at:
+                inc.due_at = inc.response_started_at + _resolve_time(inc)
+                record(s, "incident_resolving", utcnow(), incident=inc)
             else:
-                fatigue_tick([member], -random.uniform(1, 3))
-                if member.fatigue < 70:
-                    member.on_shift = True
-            s.add(member)
+                inc.due_at = inc.created_at + timedelta(seconds=inc.deadline_s)
+        pending = s.exec(select(Dispatch).where(Dispatch.active, Dispatch.due_at.is_(None))).all()
+        units = _by_id(s, Unit, (dispatch.unit_id for dispatch in pending))
+        for dispatch in pending:
+            unit = units.get(dispatch.unit_id)
+            enroute = unit is not None and unit.status == "enroute"
+            dispatch.due_at = (dispatch.arrive_at if enroute else dispatch.return_at) or utcnow()
+        s.commit()
+
+
+def _advance_downtime(unit: Unit, now: datetime):
+    if unit.status == "broken":
+        unit.status = "maintenance"
+        unit.down_until = now + timedelta(minutes=10)
+    elif unit.status == "maintenance":
+        unit.status = "available"
+        unit.condition = min(1.0, unit.condition + 0.25)
+        unit.location_x = unit.home_x
+        unit.location_y = unit.home_y
+        unit.down_until = None
+
+
+def _advance_dispatch(dispatch: Dispatch, unit: Unit, inc: Incident, now: datetime) -> bool:
+    # Returns True when the unit arrived on scene during this call.
+    if unit.status == "enroute" and dispatch.arrive_at and now >= dispatch.arrive_at:
+        if rng.random() < 0.05 * (1.2 - unit.condition):
+            unit.status = "broken"
+            unit.down_until = now + timedelta(minutes=15)
+            dispatch.active = False
+            dispatch.due_at = None
+            return False
+        unit.status = "at_scene"
+        unit.location_x = inc.grid_x
+        unit.location_y = inc.grid_y
+        dispatch.arrive_at = now
+        dispatch.return_at = now + timedelta(seconds=RESOLVE_TICK_BASE + inc.severity * 30)
+        dispatch.due_at = dispatch.return_at
+        return True
 
+    if unit.status == "at_scene" and dispatch.return_at and now >= dispatch.return_at:
+        unit.status = "returning"
+        back = return_time_s(unit, inc.grid_x, inc.grid_y)
+        if back is None:
+            back = dispatch.travel_time_s
+        dispatch.return_at = now + timedelta(seconds=max(MIN_TRAVEL_TIME, back) + RETURN_BUFFER)
+        dispatch.due_at = dispatch.return_at
+    elif unit.status == "returning" and dispatch.return_at and now >= dispatch.return_at:
+        unit.status = "available"
+        unit.location_x = unit.home_x
+        unit.location_y = unit.home_y
+        dispatch.active = False
+        dispatch.due_at = None
+    return False
+
+
+def _finish_incident(store, inc: Incident, gs: GameState, now: datetime):
+    inc.due_at = None
+    if inc.status == "resolving":
+        hospital = store.nearest_hospital(inc)
+        ambulances_needed = inc.need_ambulance
+        inc.resolved_at = now
+        if hospital and hospital.occupied + ambulances_needed <= hospital.capacity:
+            hospital.occupied += max(1, ambulances_needed)
+            inc.status = "resolved"
+            gs.funds += inc.cash_reward
+            gs.xp += inc.xp_reward
+            gs.incidents_resolved += 1
+            store.record("incident_resolved", now, incident=inc, gamestate=gs, hospital=hospital)
+        else:
+            inc.status = "failed"
+            gs.incidents_failed += 1
+            gs.funds = max(0, gs.funds - int(inc.cash_reward * 0.2))
+            store.record("incident_failed", now, incident=inc, gamestate=gs)
+    else:
+        # Deadline passed without the requirements being met.
+        inc.status = "failed"
+        gs.incidents_failed += 1
+        store.record("incident_failed", now, incident=inc, gamestate=gs)
+
+
+class _SessionStore:
+    # What one tick reads, answered by the database. world.MemoryWorld answers the
+    # same calls from rows held in memory, so both engine modes share _run_tick().
+
+    def __init__(self, session):
+        self.session = session
+
+    def down_units(self, now: datetime) -> List[Unit]:
+        return _in_id_order(self.session.exec(_down_units_query(now)))
+
+    def due_dispatches(self, now: datetime) -> List[Dispatch]:
+        return _in_id_order(self.session.exec(_due_dispatches_query(now)))
+
+    def units(self, ids) -> Dict[int, Unit]:
+        return _by_id(self.session, Unit, ids)
+
+    def incidents(self, ids) -> Dict[int, Incident]:
+        return _by_id(self.session, Incident, ids)
+
+    def requirement_counts(self) -> Dict[int, Dict[str, int]]:
+        return requirement_counts(self.session)
+
+    def unconditional_incidents(self) -> List[Incident]:
+        return _in_id_order(self.session.exec(_unconditional_incidents_query()))
+
+    def due_incidents(self, now: datetime) -> List[Incident]:
+        return _in_id_order(self.session.exec(_due_incidents_query(now)))
+
+    def crew_state(self):
+        # Plain column tuples: no Personnel objects to build, track and flush one by one.
+        return self.session.exec(
+            select(Personnel.id, Personnel.fatigue, Personnel.rest_until, Personnel.on_shift, Unit.status, Personnel.version)
+            .join(Unit, Unit.id == Personnel.unit_id, isouter=True)
+            .order_by(Personnel.id)
+        ).all()
+
+    def update_crew(self, changes: List[dict]):
+        if changes:
+            self.session.execute(update(Personnel), changes)
+
+    def nearest_hospital(self, inc: Incident) -> Optional[Hospital]:
+        return _nearest_hospital(self.session, inc)
+
+    def record(self, kind: str, at: datetime, **sections):
+        record(self.session, kind, at, **sections)
+
+
+def _run_tick(store, gs: GameState, now: datetime):
+    # Every step selects only rows whose timer is due (via the due_at / down_until
+    # indexes) and batch-loads their related rows, so cost follows the events due
+    # this tick rather than the size of the world.
+    for unit in store.down_units(now):
+        previous = unit.status
+        _advance_downtime(unit, now)
+        store.record(unit_event_kind(previous, unit.status), now, unit=unit)
+
+    due_dispatches = store.due_dispatches(now)
+    tick_dispatches.observe(len(due_dispatches))
+    units = store.units(dispatch.unit_id for dispatch in due_dispatches)
+    incidents = store.incidents(dispatch.incident_id for dispatch in due_dispatches)
+    arrived = set()
+    for dispatch in due_dispatches:
+        unit = units.get(dispatch.unit_id)
+        inc = incidents.get(dispatch.incident_id)
+        if not unit or not inc:
+            dispatch.active = False
+            dispatch.due_at = None
+            store.record("dispatch_cancelled", now, dispatch=dispatch)
+            continue
+        previous = unit.status
+        if _advance_dispatch(dispatch, unit, inc, now) and inc.status == "responding":
+            arrived.add(inc.id)
+        if unit.status != previous:
+            store.record(unit_event_kind(previous, unit.status), now, unit=unit, dispatch=dispatch)
+
+    counts = store.requirement_counts()
+    candidates = list(store.incidents(counts).values())
+    # Incidents without requirements never get a dispatch to join against.
+    candidates += store.unconditional_incidents()
+    empty = {"fire": 0, "ambulance": 0, "other": 0}
+    for inc in candidates:
+        found = counts.get(inc.id, empty)
+        if found["fire"] >= inc.need_fire and found["ambulance"] >= inc.need_ambulance:
+            inc.status = "resolving"
+            inc.response_started_at = now if inc.id in arrived else (inc.response_started_at or now)
+            inc.due_at = inc.response_started_at + _resolve_time(inc)
+            store.record("incident_resolving", now, incident=inc)
+
+    for inc in store.due_incidents(now):
+        # Deadlines are exclusive: an incident exactly at its deadline gets one more tick.
+        if inc.status != "resolving" and now <= inc.due_at:
+            continue
+        _finish_incident(store, inc, gs, now)
+
+    store.update_crew(crew_step(store.crew_state(), now))
+
+
+@timed()
+def tick():
+    now = utcnow()
+    with engine_lock(), get_session() as s:
+        begin_write(s)
+        gs = ensure_gamestate(s)
+        _run_tick(_SessionStore(s), gs, now)
         s.commit()
@@ -0,0 +1,143 @@
+import argparse
+import heapq
+import json
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Optional, Sequence, Tuple
+
+from sqlmodel import select
+
+from .archive import archive_closed
+from .clock import ManualClock, get_clock, rng, set_clock
+from .dispatcher import auto_dispatch
+from .models import Dispatch, DispatchArchive, GameState, Incident, IncidentArchive, Unit
+from .repo import get_session, init_db, use_database
+from .seed import seed as seed_world
+from .services import SPAWN_INTERVAL_S, TICK_INTERVAL_S, tick
+from .spawner import BURST_SCENARIOS, SPAWN_MODES, SpawnScheduler, make_rate, spawn_burst
+from .world import memory_tick
+
+DEFAULT_START = datetime(2024, 1, 1)
+
+
+def _summarize() -> dict:
+    with get_session() as s:
+        gs = s.get(GameState, 1)
+        incidents = Counter(status for status in s.exec(select(Incident.status)))
+        incidents.update(s.exec(select(IncidentArchive.status)))
+        units = Counter(status for status in s.exec(select(Unit.status)))
+        dispatches = len(s.exec(select(Dispatch.id)).all()) + len(s.exec(select(DispatchArchive.id)).all())
+    return {
+        "funds": gs.funds if gs else 0,
+        "xp": gs.xp if gs else 0,
+        "incidents": dict(incidents),
+        "units": dict(units),
+        "dispatches": dispatches,
+    }
+
+
+def run_simulation(
+    hours: float = 24,
+    seed: int = 0,
+    database_url: str = "sqlite://",
+    auto_dispatch_every_s: Optional[float] = 30,
+    start: datetime = DEFAULT_START,
+    setup=seed_world,
+    archive_every_s: Optional[float] = 300,
+    engine: str = "database",
+    spawn_mode: str = "fixed",
+    spawn_rate_per_hour: float = 80.0,
+    bursts: Sequence[Tuple[float, str]] = (),
+) -> dict:
+    # Runs the scheduler's jobs back to back on a manual clock against a scratch
+    # database: same service functions, no web server and no sleeping.
+    clock = ManualClock(start)
+    previous_clock = get_clock()
+    set_clock(clock)
+    rng.seed(seed)
+    spawner = SpawnScheduler(make_rate(spawn_mode, spawn_rate_per_hour))
+    jobs = [("tick", memory_tick if engine == "memory" else tick, TICK_INTERVAL_S), ("spawn", spawner.run, SPAWN_INTERVAL_S)]
+    if auto_dispatch_every_s:
+        jobs.append(("auto_dispatch", auto_dispatch, auto_dispatch_every_s))
+    if archive_every_s:
+        jobs.append(("archive", archive_closed, archive_every_s))
+    runs = Counter()
+    end = start + timedelta(hours=hours)
+    started = time.perf_counter()
+    try:
+        with use_database(database_url):
+            init_db()
+            setup()
+            # (due, order, ...) so simultaneous jobs always run in the same order.
+            queue = [(start + timedelta(seconds=interval), order, name, job, interval) for order, (name, job, interval) in enumerate(jobs)]
+            # Bursts run once, at their offset in game hours.
+            queue += [
+                (start + timedelta(hours=at), len(jobs) + order, f"burst:{scenario}", partial(spawn_burst, scenario), None)
+                for order, (at, scenario) in enumerate(bursts)
+            ]
+            heapq.heapify(queue)
+            while queue and queue[0][0] <= end:
+                due, order, name, job, interval = heapq.heappop(queue)
+                clock.advance_to(due)
+                job()
+                runs[name] += 1
+                if interval:
+                    heapq.heappush(queue, (due + timedelta(seconds=interval), order, name, job, interval))
+            summary = _summarize()
+    finally:
+        set_clock(previous_clock)
+    wall_s = time.perf_counter() - started
+    summary.update(
+        {
+            "seed": seed,
+            "game_hours": hours,
+            "wall_s": round(wall_s, 3),
+            "speedup": round(hours * 3600 / wall_s, 1) if wall_s else None,
+            "runs": dict(runs),
+        }
+    )
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the dispatch engine headless on an accelerated clock.")
+    parser.add_argument("--hours", type=float, default=24, help="game time to simulate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", default="sqlite://", help="defaults to a private in-memory database")
+    parser.add_argument(
+        "--auto-dispatch", type=float, default=30, help="seconds between auto-dispatch runs; 0 disables it"
+    )
+    parser.add_argument("--engine", choices=["database", "memory"], default="database")
+    parser.add_argument("--spawn", choices=SPAWN_MODES, default="fixed", help="spawn rate model")
+    parser.add_argument("--spawn-rate", type=float, default=80.0, help="mean incidents per hour (poisson, time_of_day)")
+    parser.add_argument(
+        "--burst",
+        action="append",
+        default=[],
+        metavar="SCENARIO@HOURS",
+        help=f"inject a burst scenario ({', '.join(BURST_SCENARIOS)}) at a game-hour offset; repeatable",
+    )
+    args = parser.parse_args(argv)
+    bursts = []
+    for value in args.burst:
+        scenario, _, at = value.partition("@")
+        if scenario not in BURST_SCENARIOS or not at:
+            parser.error(f"--burst expects SCENARIO@HOURS with SCENARIO one of {', '.join(BURST_SCENARIOS)}")
+        bursts.append((float(at), scenario))
+    summary = run_simulation(
+        args.hours,
+        args.seed,
+        args.database,
+        args.auto_dispatch or None,
+        engine=args.engine,
+        spawn_mode=args.spawn,
+        spawn_rate_per_hour=args.spawn_rate,
+        bursts=bursts,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import List
+
+from .clock import utcnow
+from .config import settings
+from .repo import DEFAULT_TENANT, current_tenant, init_db, sync_versions, use_database, use_tenant
+from .seed import seed_synthetic
+from .services import engine_lock
+
+SNAPSHOT_SUFFIX = ".sqlite.gz"
+SNAPSHOT_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,79}$")
+_COPY_CHUNK = 1 << 20
+
+
+@contextmanager
+def _sqlite(engine):
+    if engine.url.get_backend_name() != "sqlite":
+        raise ValueError("world snapshots need a SQLite database")
+    raw = engine.raw_connection()
+    try:
+        yield raw.driver_connection
+    finally:
+        raw.close()
+
+
+def save_snapshot(path) -> dict:
+    # VACUUM INTO copies one consistent read transaction, compacted, without holding the
+    # write lock, so a tick can run while the copy is taken. The copy is then gzipped.
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=path.parent) as tmp:
+        copy = Path(tmp) / "world.db"
+        with _sqlite(current_tenant().engine) as conn:
+            conn.execute("VACUUM INTO ?", (str(copy),))
+        with open(copy, "rb") as src, gzip.open(Path(tmp) / "world.gz", "wb", compresslevel=1) as dst:
+            shutil.copyfileobj(src, dst, _COPY_CHUNK)
+        os.replace(Path(tmp) / "world.gz", path)
+    return {"path": str(path), "bytes": path.stat().st_size, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def restore_snapshot(path) -> dict:
+    # Replaces the whole database with the snapshot in one SQLite backup step, which
+    # holds the write lock throughout: ticks in this process wait on engine_lock, ticks
+    # in other processes on the database lock, and readers see either world, never a mix.
+    started = time.perf_counter()
+    tenant = current_tenant()
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = Path(tmp) / "world.db"
+        with gzip.open(path, "rb") as src, open(copy, "wb") as dst:
+            shutil.copyfileobj(src, dst, _COPY_CHUNK)
+        with closing(sqlite3.connect(copy)) as snap:
+            try:
+                tables = {row[0] for row in snap.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            except sqlite3.DatabaseError as exc:
+                raise ValueError(f"{path} is not a world snapshot") from exc
+            if not {"gamestate", "tableversion", "leaderlease", "gameevent"} <= tables:
+                raise ValueError(f"{path} is not a world snapshot")
+            with engine_lock(), _sqlite(tenant.engine) as live:
+                # The live counters only move forward, so no process mistakes the restored
+                # world for one it cached before; the live leases stay with their holders.
+                versions = dict(live.execute("SELECT name, version FROM tableversion"))
+                for name, version in snap.execute("SELECT name, version FROM tableversion"):
+                    versions[name] = max(version, versions.get(name, 0))
+                leases = live.execute("SELECT name, holder, expires_at FROM leaderlease").fetchall()
+                # The snapshot brings its own event log; a marker numbered after every live
+                # event keeps ids growing, so /events/log?after= readers miss nothing.
+                last_event = max(
+                    live.execute("SELECT COALESCE(MAX(id), 0) FROM gameevent").fetchone()[0],
+                    snap.execute("SELECT COALESCE(MAX(id), 0) FROM gameevent").fetchone()[0],
+                )
+                with snap:
+                    snap.execute("DELETE FROM tableversion")
+                    snap.executemany(
+                        "INSERT INTO tableversion (name, version) VALUES (?, ?)",
+                        [(name, version + 1) for name, version in versions.items()],
+                    )
+                    snap.execute("DELETE FROM leaderlease")
+                    snap.executemany("INSERT INTO leaderlease (name, holder, expires_at) VALUES (?, ?, ?)", leases)
+                    snap.execute(
+                        "INSERT INTO gameevent (id, at, kind, data) VALUES (?, ?, 'world_restored', '{}')",
+                        (last_event + 1, utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")),
+                    )
+                snap.backup(live)
+    # Snapshots from an older schema are brought up to date like any old game.db.
+    init_db()
+    sync_versions()
+    return {"path": str(path), "seconds": round(time.perf_counter() - started, 3)}
+
+
+def snapshot_path(name: str) -> Path:
+    if not SNAPSHOT_NAME.match(name) or name.startswith(".."):
+        raise ValueError(f"invalid snapshot name {name!r}")
+    return Path(settings.snapshot_dir) / current_tenant().name / f"{name}{SNAPSHOT_SUFFIX}"
+
+
+def list_snapshots() -> List[str]:
+    folder = Path(settings.snapshot_dir) / current_tenant().name
+    return sorted(path.name[: -len(SNAPSHOT_SUFFIX)] for path in folder.glob(f"*{SNAPSHOT_SUFFIX}"))
+
+
+def generate_snapshot(path, stations: int, units: int, incidents: int, personnel: int, seed: int = 0) -> dict:
+    # Builds a synthetic world once in a scratch database, so large benchmark worlds are
+    # restored in a fraction of the time it takes to generate them.
+    with tempfile.TemporaryDirectory() as tmp, use_database(f"sqlite:///{Path(tmp) / 'world.db'}"):
+        started = time.perf_counter()
+        seed_synthetic(stations, units, incidents, personnel, seed=seed)
+        result = save_snapshot(path)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Save, restore or generate compressed world snapshots.")
+    parser.add_argument("--tenant", default=None, help="dispatch center to act on (default: the default tenant)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("save").add_argument("path")
+    commands.add_parser("restore").add_argument("path")
+    generate = commands.add_parser("generate")
+    generate.add_argument("path")
+    generate.add_argument("--stations", type=int, default=500)
+    generate.add_argument("--units", type=int, default=20000)
+    generate.add_argument("--incidents", type=int, default=50000)
+    generate.add_argument("--personnel", type=int, default=30000)
+    generate.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        result = generate_snapshot(args.path, args.stations, args.units, args.incidents, args.personnel, args.seed)
+    else:
+        with use_tenant(args.tenant or DEFAULT_TENANT):
+            init_db()
+            result = save_snapshot(args.path) if args.command == "save" else restore_snapshot(args.path)
+    sys.stdout.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
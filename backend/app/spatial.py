@@ -0,0 +1,142 @@
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlmodel import select
+
+from .cache import VersionedValue
+from .models import Hospital, Station
+from .repo import current_tenant, get_read_session
+
+try:
+    import numpy as np
+except ImportError:  # optional: batch lookups fall back to per-point searches
+    np = None
+
+
+BUCKET_SIZE = 4
+
+
+class Site(NamedTuple):
+    id: int
+    x: int
+    y: int
+    kind: str = ""
+
+
+class GridIndex:
+    # Buckets sites into BUCKET_SIZE squares and answers Manhattan k-nearest queries by
+    # scanning rings of buckets outward until no closer site can exist.
+
+    def __init__(self, sites: Iterable[Site] = (), bucket_size: int = BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self._buckets: Dict[Tuple[int, int], List[Site]] = defaultdict(list)
+        self._sites: List[Site] = []
+        self._extent = (0, 0, 0, 0)
+        for site in sites:
+            self.insert(site)
+
+    def __len__(self):
+        return len(self._sites)
+
+    def insert(self, site: Site):
+        bx, by = site.x // self.bucket_size, site.y // self.bucket_size
+        self._buckets[(bx, by)].append(site)
+        if self._sites:
+            min_x, min_y, max_x, max_y = self._extent
+            self._extent = (min(min_x, bx), min(min_y, by), max(max_x, bx), max(max_y, by))
+        else:
+            self._extent = (bx, by, bx, by)
+        self._sites.append(site)
+
+    def _ring(self, cx: int, cy: int, r: int):
+        if r == 0:
+            yield cx, cy
+            return
+        for dx in range(-r, r + 1):
+            yield cx + dx, cy - r
+            yield cx + dx, cy + r
+        for dy in range(-r + 1, r):
+            yield cx - r, cy + dy
+            yield cx + r, cy + dy
+
+    def nearest(
+        self, x: int, y: int, k: int = 1, predicate: Optional[Callable[[Site], bool]] = None
+    ) -> List[Tuple[int, Site]]:
+        if not self._sites or k <= 0:
+            return []
+        cx, cy = x // self.bucket_size, y // self.bucket_size
+        min_x, min_y, max_x, max_y = self._extent
+        max_ring = max(abs(cx - min_x), abs(cx - max_x), abs(cy - min_y), abs(cy - max_y))
+        found: List[Tuple[int, int, Site]] = []
+        for r in range(max_ring + 1):
+            # Every site in ring r is at least this far away along one axis.
+            lower_bound = max(0, (r - 1) * self.bucket_size + 1)
+            if len(found) >= k and found[k - 1][0] < lower_bound:
+                break
+            for bucket in self._ring(cx, cy, r):
+                for site in self._buckets.get(bucket, ()):
+                    if predicate and not predicate(site):
+                        continue
+                    found.append((abs(site.x - x) + abs(site.y - y), site.id, site))
+            # Ties resolve to the lowest id, matching a stable sort over rows by id.
+            found.sort(key=lambda entry: entry[:2])
+        return [(distance, site) for distance, _, site in found[:k]]
+
+    def nearest_batch(
+        self, points: Sequence[Tuple[int, int]], k: int = 1, predicate: Optional[Callable[[Site], bool]] = None
+    ) -> List[List[Tuple[int, Site]]]:
+        sites = [site for site in self._sites if not predicate or predicate(site)]
+        if np is None or not sites or not points:
+            return [self.nearest(x, y, k, predicate) for x, y in points]
+        # Rank by (distance, id) so ties break the same way as nearest().
+        order = sorted(range(len(sites)), key=lambda i: sites[i].id)
+        sites = [sites[i] for i in order]
+        coords = np.array([(site.x, site.y) for site in sites], dtype=np.int64)
+        queries = np.asarray(points, dtype=np.int64)
+        k = min(k, len(sites))
+        results = []
+        # Chunked so a city-scale batch never materialises one huge distance matrix.
+        chunk = max(1, 2_000_000 // len(sites))
+        for start in range(0, len(queries), chunk):
+            block = queries[start : start + chunk]
+            distances = np.abs(block[:, None, :] - coords[None, :, :]).sum(axis=2)
+            ranked = np.argsort(distances, axis=1, kind="stable")[:, :k]
+            for row, columns in enumerate(ranked):
+                results.append([(int(distances[row, col]), sites[col]) for col in columns])
+        return results
+
+
+def _load_hospital_index() -> GridIndex:
+    with get_read_session() as s:
+        return GridIndex(Site(id, x, y) for id, x, y in s.exec(select(Hospital.id, Hospital.grid_x, Hospital.grid_y)))
+
+
+def hospital_index() -> GridIndex:
+    # Positions only, keyed like city_anchors(): hospitals never move, and their bed
+    # counts are read from the live rows of whichever hospital is picked.
+    tenant = current_tenant()
+    return tenant.local("hospital_index", lambda: VersionedValue(tenant.versions, ("station",), _load_hospital_index)).get()
+
+
+class CityAnchors(NamedTuple):
+    # One entry per station, so cities with more stations draw more incidents.
+    cities: Tuple[str, ...]
+    # City -> its first station, or its first hospital when it has no station.
+    anchors: Dict[str, Tuple[int, int]]
+
+
+def _load_city_anchors() -> CityAnchors:
+    with get_read_session() as s:
+        stations = s.exec(select(Station.city, Station.grid_x, Station.grid_y).order_by(Station.id)).all()
+        hospitals = s.exec(select(Hospital.city, Hospital.grid_x, Hospital.grid_y).order_by(Hospital.id)).all()
+    anchors: Dict[str, Tuple[int, int]] = {}
+    for city, x, y in [*stations, *hospitals]:
+        anchors.setdefault(city, (x, y))
+    return CityAnchors(tuple(city for city, _, _ in stations), anchors)
+
+
+def city_anchors() -> CityAnchors:
+    # Keyed on stations only: hospitals never move and are only ever added by seeding,
+    # which rewrites the stations too, while their bed counts change every few ticks.
+    tenant = current_tenant()
+    return tenant.local("city_anchors", lambda: VersionedValue(tenant.versions, ("station",), _load_city_anchors)).get()
@@ -0,0 +1,142 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .clock import rng, utcnow
+from .services import BASE_GRID_SIZE, CITIES_FALLBACK, SPAWN_INTERVAL_S, engine_lock, grid_bounds, spawn_incidents
+from .spatial import city_anchors
+
+# Relative call volume per hour of day (mean ~1): quiet small hours, a morning rise and
+# an evening peak.
+DAY_CURVE = (
+    0.6, 0.5, 0.4, 0.35, 0.35, 0.45,
+    0.7, 1.0, 1.15, 1.1, 1.05, 1.1,
+    1.15, 1.1, 1.1, 1.2, 1.35, 1.45,
+    1.5, 1.45, 1.3, 1.1, 0.9, 0.75,
+)
+# A scheduler that missed runs (lost the engine lease, stalled) catches up at most this
+# many intervals instead of dumping hours of backlog at once.
+MAX_CATCH_UP_INTERVALS = 4
+
+
+class FixedRate:
+    # One incident per run: the original fixed-interval behaviour.
+
+    def count(self, start: datetime, end: datetime) -> int:
+        return 1
+
+
+class PoissonRate:
+    def __init__(self, per_hour: float):
+        self.per_hour = per_hour
+
+    def rate_at(self, at: datetime) -> float:
+        return self.per_hour
+
+    def peak(self) -> float:
+        return self.per_hour
+
+    def count(self, start: datetime, end: datetime) -> int:
+        # Arrivals of a Poisson process at the peak rate, each kept with probability
+        # rate_at / peak (thinning), so rate curves need nothing but rate_at().
+        peak = self.peak()
+        if peak <= 0:
+            return 0
+        arrivals, at = 0, start
+        while True:
+            at += timedelta(seconds=rng.expovariate(peak / 3600))
+            if at > end:
+                return arrivals
+            rate = self.rate_at(at)
+            if rate >= peak or rng.random() * peak < rate:
+                arrivals += 1
+
+
+class TimeOfDayRate(PoissonRate):
+    # per_hour is the daily mean; the curve is interpolated between whole hours.
+
+    def __init__(self, per_hour: float, curve: Sequence[float] = DAY_CURVE):
+        super().__init__(per_hour)
+        mean = sum(curve) / len(curve)
+        self.curve = tuple(value / mean for value in curve)
+
+    def rate_at(self, at: datetime) -> float:
+        hour = at.hour + at.minute / 60 + at.second / 3600
+        low = int(hour) % len(self.curve)
+        high = (low + 1) % len(self.curve)
+        weight = hour - int(hour)
+        return self.per_hour * (self.curve[low] * (1 - weight) + self.curve[high] * weight)
+
+    def peak(self) -> float:
+        return self.per_hour * max(self.curve)
+
+
+SPAWN_MODES = ("fixed", "poisson", "time_of_day")
+
+
+def make_rate(mode: str, per_hour: float):
+    if mode == "fixed":
+        return FixedRate()
+    if mode == "poisson":
+        return PoissonRate(per_hour)
+    if mode == "time_of_day":
+        return TimeOfDayRate(per_hour)
+    raise ValueError(f"unknown spawn mode {mode!r}; expected one of {', '.join(SPAWN_MODES)}")
+
+
+class SpawnScheduler:
+    # Run every interval; each run spawns however many incidents the rate curve yields
+    # for the time since the previous run, all in one transaction.
+
+    def __init__(self, rate, interval_s: float = SPAWN_INTERVAL_S):
+        self.rate = rate
+        self.interval_s = interval_s
+        self.last_run: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def run(self) -> List[int]:
+        with self._lock:
+            now = utcnow()
+            earliest = now - timedelta(seconds=self.interval_s * MAX_CATCH_UP_INTERVALS)
+            start = max(self.last_run or now - timedelta(seconds=self.interval_s), earliest)
+            self.last_run = now
+            return spawn_incidents(self.rate.count(start, now))
+
+
+class Burst(NamedTuple):
+    count: int
+    kinds: Tuple[str, ...]
+    # Incidents land within `spread` cells of one scene.
+    spread: int = 2
+    severity: Tuple[int, int] = (3, 5)
+
+
+BURST_SCENARIOS: Dict[str, Burst] = {
+    "mass_casualty": Burst(50, ("medical", "traffic"), spread=1, severity=(3, 5)),
+    "pileup": Burst(12, ("traffic",), spread=2, severity=(2, 4)),
+    "wildfire": Burst(20, ("fire",), spread=4, severity=(2, 5)),
+}
+
+
+def spawn_burst(name: str, city: Optional[str] = None) -> List[int]:
+    burst = BURST_SCENARIOS.get(name)
+    if burst is None:
+        raise ValueError(f"unknown burst scenario {name!r}; expected one of {', '.join(BURST_SCENARIOS)}")
+    with engine_lock():
+        anchors = city_anchors()
+        if city is None:
+            city = rng.choice(anchors.cities or CITIES_FALLBACK)
+        anchor_x, anchor_y = anchors.anchors.get(city) or (
+            rng.randint(0, BASE_GRID_SIZE),
+            rng.randint(0, BASE_GRID_SIZE),
+        )
+        scene = (grid_bounds(anchor_x + rng.randint(-3, 3)), grid_bounds(anchor_y + rng.randint(-3, 3)))
+        return spawn_incidents(
+            burst.count,
+            source=name,
+            kinds=burst.kinds,
+            city=city,
+            origin=scene,
+            spread=burst.spread,
+            severity=burst.severity,
+        )
@@ -0,0 +1,232 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from . import repo
+from .clock import utcnow
+from .eventlog import capture, record_captured
+from .metrics import timed
+from .models import Dispatch, GameState, Hospital, Incident, Personnel, Unit
+from .services import OPEN_STATUSES, _in_id_order, _run_tick, engine_lock, ensure_gamestate
+from .spatial import hospital_index
+
+# Load order matters: incidents are loaded for the dispatches that reference them.
+WORLD_TABLES = (
+    ("gamestate", GameState),
+    ("hospital", Hospital),
+    ("unit", Unit),
+    ("personnel", Personnel),
+    ("dispatch", Dispatch),
+    ("incident", Incident),
+)
+
+
+def _row_class(model):
+    # Plain __slots__ record with the model's column names, so the service helpers
+    # (_advance_dispatch, _finish_incident, ...) and the event log work on it unchanged.
+    columns = tuple(column.name for column in model.__table__.columns)
+
+    def __init__(self, values):
+        for name, value in zip(columns, values):
+            setattr(self, name, value)
+
+    return type(f"{model.__name__}Row", (), {"__slots__": columns, "__init__": __init__, "__table__": model.__table__})
+
+
+ROW_CLASSES = {name: _row_class(model) for name, model in WORLD_TABLES}
+COLUMNS = {name: tuple(column.name for column in model.__table__.columns) for name, model in WORLD_TABLES}
+
+
+class MemoryWorld:
+    # Holds the live rows the tick touches (all units, crew, hospitals; active
+    # dispatches and the incidents they or the open list reference) as slot records.
+    # A tick runs against them and then writes back only the columns that changed,
+    # one executemany per table and column set. Tables changed by anything else
+    # (spawns, manual dispatch, resets, other processes) are reloaded before the next tick.
+
+    def __init__(self):
+        self.rows: Dict[str, Dict[int, object]] = {name: {} for name, _ in WORLD_TABLES}
+        self._persisted: Dict[str, Dict[int, tuple]] = {name: {} for name, _ in WORLD_TABLES}
+        # Shared table versions the rows were loaded or written at; -1 until first loaded.
+        self._seen: Dict[str, Optional[int]] = {name: -1 for name, _ in WORLD_TABLES}
+        self._events: List[tuple] = []
+
+    def _query(self, name, model):
+        table = model.__table__
+        if name == "dispatch":
+            return select(table).where(table.c.active)
+        if name == "incident":
+            referenced = {dispatch.incident_id for dispatch in self.rows["dispatch"].values()}
+            return select(table).where(table.c.status.in_(OPEN_STATUSES) | table.c.id.in_(referenced))
+        return select(table)
+
+    def refresh(self, session=None):
+        if session is None:
+            with repo.get_read_session() as s:
+                repo.begin_read(s)
+                return self.refresh(s)
+        # Read inside the session's transaction, so the versions describe the rows loaded
+        # below; under the write lock nothing can commit in between.
+        shared = repo.sync_versions(session)
+        stale = {name for name, _ in WORLD_TABLES if shared.get(name) != self._seen[name]}
+        if "dispatch" in stale:
+            stale.add("incident")
+        for name, model in WORLD_TABLES:
+            if name not in stale:
+                continue
+            self._seen[name] = shared.get(name)
+            row_class = ROW_CLASSES[name]
+            rows, persisted = {}, {}
+            for values in session.execute(self._query(name, model)):
+                values = tuple(values)
+                rows[values[0]] = row_class(values)
+                persisted[values[0]] = values
+            self.rows[name] = rows
+            self._persisted[name] = persisted
+
+    def flush(self, s):
+        for name, model in WORLD_TABLES:
+            columns = COLUMNS[name]
+            persisted = self._persisted[name]
+            # One executemany per distinct set of changed columns.
+            batches: Dict[Tuple[str, ...], List[dict]] = {}
+            for row_id, row in self.rows[name].items():
+                values = tuple(getattr(row, column) for column in columns)
+                before = persisted.get(row_id)
+                if before == values:
+                    continue
+                changed = tuple(column for column, old, new in zip(columns, before, values) if old != new)
+                if "version" in columns and "version" not in changed:
+                    row.version += 1
+                    changed += ("version",)
+                    values = tuple(getattr(row, column) for column in columns)
+                batches.setdefault(changed, []).append({"id": row_id, **{c: getattr(row, c) for c in changed}})
+                persisted[row_id] = values
+            for rows in batches.values():
+                s.execute(update(model), rows)
+        record_captured(s, self._events)
+        self._events = []
+        s.commit()
+        # Tables this commit wrote moved to the versions it set; the write lock kept every
+        # other commit out, so the rest are still at the versions refresh() read.
+        for name, version in s.info.get("written_versions", {}).items():
+            if name in self._seen:
+                self._seen[name] = version
+        self._drop_finished()
+
+    def _drop_finished(self):
+        dispatches = self.rows["dispatch"]
+        for row_id in [row_id for row_id, dispatch in dispatches.items() if not dispatch.active]:
+            del dispatches[row_id]
+            del self._persisted["dispatch"][row_id]
+        referenced = {dispatch.incident_id for dispatch in dispatches.values()}
+        incidents = self.rows["incident"]
+        for row_id in [i for i, inc in incidents.items() if inc.status not in OPEN_STATUSES and i not in referenced]:
+            del incidents[row_id]
+            del self._persisted["incident"][row_id]
+
+    def tick(self, now: datetime):
+        # engine_lock keeps this process's writers out; the database write lock, held
+        # from the version check to the write-back, keeps other processes' commits from
+        # landing in between and being overwritten with stale rows.
+        with engine_lock(), repo.get_session() as s:
+            repo.begin_write(s)
+            self.refresh(s)
+            gs = self.rows["gamestate"].get(1)
+            if gs is None:
+                ensure_gamestate(s)
+                repo.begin_write(s)
+                self.refresh(s)
+                gs = self.rows["gamestate"][1]
+            _run_tick(self, gs, now)
+            self.flush(s)
+
+    # The store interface _run_tick() reads through; see services._SessionStore.
+
+    def down_units(self, now: datetime):
+        due = [
+            unit
+            for unit in self.rows["unit"].values()
+            if unit.status in ("broken", "maintenance") and unit.down_until is not None and unit.down_until <= now
+        ]
+        return _in_id_order(due)
+
+    def due_dispatches(self, now: datetime):
+        due = [d for d in self.rows["dispatch"].values() if d.active and d.due_at is not None and d.due_at <= now]
+        return _in_id_order(due)
+
+    def _by_id(self, name, ids) -> dict:
+        rows = self.rows[name]
+        return {row_id: rows[row_id] for row_id in sorted(set(ids)) if row_id in rows}
+
+    def units(self, ids):
+        return self._by_id("unit", ids)
+
+    def incidents(self, ids):
+        return self._by_id("incident", ids)
+
+    def requirement_counts(self) -> Dict[int, Dict[str, int]]:
+        units, incidents = self.rows["unit"], self.rows["incident"]
+        counts: Dict[int, Dict[str, int]] = {}
+        for dispatch in self.rows["dispatch"].values():
+            unit, inc = units.get(dispatch.unit_id), incidents.get(dispatch.incident_id)
+            if not dispatch.active or not unit or not inc:
+                continue
+            if unit.status not in ("enroute", "at_scene") or inc.status not in ("new", "responding"):
+                continue
+            entry = counts.setdefault(inc.id, {"fire": 0, "ambulance": 0, "other": 0})
+            entry[unit.kind if unit.kind in ("fire", "ambulance") else "other"] += 1
+        return counts
+
+    def unconditional_incidents(self):
+        found = [
+            inc
+            for inc in self.rows["incident"].values()
+            if inc.status in ("new", "responding") and inc.need_fire <= 0 and inc.need_ambulance <= 0
+        ]
+        return _in_id_order(found)
+
+    def due_incidents(self, now: datetime):
+        due = [
+            inc
+            for inc in self.rows["incident"].values()
+            if inc.status in OPEN_STATUSES and inc.due_at is not None and inc.due_at <= now
+        ]
+        return _in_id_order(due)
+
+    def crew_state(self):
+        units, personnel = self.rows["unit"], self.rows["personnel"]
+        crew = []
+        for member_id in sorted(personnel):
+            member = personnel[member_id]
+            unit = units.get(member.unit_id)
+            unit_status = unit.status if unit else None
+            crew.append((member.id, member.fatigue, member.rest_until, member.on_shift, unit_status, member.version))
+        return crew
+
+    def update_crew(self, changes: List[dict]):
+        personnel = self.rows["personnel"]
+        for change in changes:
+            member = personnel[change["id"]]
+            for column in ("fatigue", "rest_until", "on_shift", "version"):
+                setattr(member, column, change[column])
+
+    def nearest_hospital(self, inc):
+        nearest = hospital_index().nearest(inc.grid_x, inc.grid_y)
+        if not nearest:
+            return None
+        return self.rows["hospital"].get(nearest[0][1].id)
+
+    def record(self, kind: str, at: datetime, **sections):
+        self._events.append(capture(kind, at, **sections))
+
+
+def memory_world() -> MemoryWorld:
+    tenant = repo.current_tenant()
+    return tenant.local("memory_world", MemoryWorld)
+
+
+@timed()
+def memory_tick():
+    memory_world().tick(utcnow())
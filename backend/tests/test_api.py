@@ -0,0 +1,47 @@
+import gzip
+import json
+
+import pytest
+
+from app import api
+from app.api import StateHistory, encode
+from app.repo import init_db, touch_tables, use_database
+from app.seed import seed
+from app.services import spawn_incident
+
+
+def test_deltas_reload_only_changed_tables(tmp_path):
+    with use_database(f"sqlite:///{tmp_path / 'world.db'}"):
+        init_db()
+        seed()
+        history = StateHistory(4)
+        first = history.delta()
+        assert first["full"] and first["changed"]["unit"]
+        loads = history.table_loads
+
+        # The per-tick clock touch moves the world version but no table.
+        touch_tables(["clock"])
+        quiet = history.delta(first["version"])
+        assert quiet["version"] != first["version"]
+        assert not quiet["full"] and quiet["changed"] == {} and quiet["removed"] == {}
+        assert history.table_loads == loads
+
+        incident_id = spawn_incident().id
+        spawned = history.delta(quiet["version"])
+        assert [row["id"] for row in spawned["changed"]["incident"]] == [incident_id]
+        assert set(spawned["changed"]) == {"incident"}
+        assert history.table_loads == loads + 1
+
+
+def test_encodings(monkeypatch):
+    msgpack = pytest.importorskip("msgpack")
+    payload = {"version": 3, "changed": {"unit": [{"id": 1, "status": "available"}] * 100}}
+    body, headers = encode(payload, "application/msgpack", compress=True)
+    assert headers["Content-Encoding"] == "gzip"
+    assert msgpack.unpackb(gzip.decompress(body)) == payload
+    body, headers = encode(payload, "application/json", compress=False)
+    assert json.loads(body) == payload and "Content-Encoding" not in headers
+
+    monkeypatch.setattr(api, "msgpack", None)
+    with pytest.raises(ValueError):
+        encode(payload, "application/msgpack", compress=False)
@@ -0,0 +1,31 @@
+import sqlite3
+from contextlib import closing
+
+from sqlmodel import select
+
+from app.archive import archive_closed
+from app.models import Dispatch, Incident, IncidentArchive
+from app.repo import get_session, init_db, use_database
+from app.seed import seed
+from app.services import dispatch_unit, spawn_incident
+
+
+def test_archive_keeps_incidents_referenced_by_kept_dispatches(tmp_path):
+    path = tmp_path / "world.db"
+    with use_database(f"sqlite:///{path}"):
+        init_db()
+        seed()
+        closed = spawn_incident().id
+        spawn_incident()
+        assert dispatch_unit(closed, 1)
+        with get_session() as s:
+            # The only (so newest) dispatch is finished and its incident resolved.
+            s.exec(select(Dispatch)).one().active = False
+            s.get(Incident, closed).status = "resolved"
+            s.commit()
+        assert archive_closed() == {"incidents": 0, "dispatches": 0}
+        with get_session() as s:
+            assert s.get(Incident, closed) is not None
+            assert not s.exec(select(IncidentArchive)).all()
+    with closing(sqlite3.connect(path)) as conn:
+        assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
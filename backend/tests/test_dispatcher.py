@@ -0,0 +1,105 @@
+import contextvars
+import random
+import threading
+import time
+from contextlib import nullcontext
+from itertools import permutations
+
+from sqlmodel import select
+
+from app import services
+from app.dispatcher import UNREACHABLE, solve_assignment
+from app.models import Dispatch
+from app.repo import get_session, init_db, use_database
+from app.seed import seed
+
+
+def _best(cost):
+    # Every way of giving each row (or, if there are fewer columns, each column) its
+    # own partner: as many finite pairs as possible first, then the lowest total.
+    rows, cols = len(cost), len(cost[0])
+    if rows <= cols:
+        matchings = ([(r, c) for r, c in enumerate(pick)] for pick in permutations(range(cols), rows))
+    else:
+        matchings = ([(r, c) for c, r in enumerate(pick)] for pick in permutations(range(rows), cols))
+    best = None
+    for pairs in matchings:
+        finite = [cost[r][c] for r, c in pairs if cost[r][c] != UNREACHABLE]
+        score = (-len(finite), sum(finite))
+        if best is None or score < best:
+            best = score
+    return best
+
+
+def test_solve_assignment_matches_brute_force():
+    r = random.Random(1)
+    for _ in range(500):
+        rows, cols = r.randint(1, 5), r.randint(1, 5)
+        cost = [[UNREACHABLE if r.random() < 0.3 else r.randint(0, 50) for _ in range(cols)] for _ in range(rows)]
+        pairs = solve_assignment(cost)
+        assert len({row for row, _ in pairs}) == len({col for _, col in pairs}) == len(pairs)
+        assert all(cost[row][col] != UNREACHABLE for row, col in pairs)
+        assert (-len(pairs), sum(cost[row][col] for row, col in pairs)) == _best(cost), cost
+
+
+def test_solve_assignment_empty():
+    assert solve_assignment([]) == []
+    assert solve_assignment([[]]) == []
+
+
+def test_concurrent_dispatches_of_one_unit(tmp_path, monkeypatch):
+    # Stands in for two processes: without engine_lock only the database lock keeps the
+    # second caller from reading the unit as free while the first is assigning it.
+    ready = services.crew_ready
+
+    def slow_ready(*args):
+        result = ready(*args)
+        time.sleep(0.3)
+        return result
+
+    monkeypatch.setattr(services, "engine_lock", nullcontext)
+    monkeypatch.setattr(services, "crew_ready", slow_ready)
+    with use_database(f"sqlite:///{tmp_path / 'world.db'}"):
+        init_db()
+        seed()
+        incident_id = services.spawn_incident().id
+        results = []
+        threads = [
+            threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(lambda: results.append(services.dispatch_unit(incident_id, 3)),),
+            )
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with get_session() as s:
+            active = s.exec(select(Dispatch).where(Dispatch.unit_id == 3, Dispatch.active)).all()
+    assert sorted(results) == [False, True]
+    assert len(active) == 1
+
+
+def test_tenants_do_not_share_the_engine_lock(tmp_path):
+    held, release = threading.Event(), threading.Event()
+
+    def hold(url):
+        with use_database(url), services.engine_lock():
+            held.set()
+            release.wait(10)
+
+    busy = threading.Thread(target=hold, args=(f"sqlite:///{tmp_path / 'busy.db'}",))
+    busy.start()
+    try:
+        assert held.wait(10)
+        with use_database(f"sqlite:///{tmp_path / 'other.db'}"):
+            init_db()
+            seed()
+            # A lock shared across tenants would still be held by the other thread.
+            assert services.engine_lock().acquire(timeout=1)
+            services.engine_lock().release()
+            assert services.dispatch_unit(services.spawn_incident().id, 1)
+    finally:
+        release.set()
+        busy.join()
@@ -0,0 +1,24 @@
+from app.main import _panel_etag
+from app.repo import init_db, sync_versions, use_database
+from app.seed import seed
+from app.services import spawn_incident
+
+PANEL = "partials/incidents.html"
+
+
+def test_workers_agree_on_panel_etags(tmp_path):
+    # Two tenants on one file stand in for two worker processes.
+    url = f"sqlite:///{tmp_path / 'world.db'}"
+    with use_database(url):
+        init_db()
+        seed()
+        with use_database(url):
+            before = _panel_etag(PANEL)
+        assert _panel_etag(PANEL) == before
+        spawn_incident()
+        after = _panel_etag(PANEL)
+        assert after != before
+        with use_database(url):
+            assert _panel_etag(PANEL) == after
+        sync_versions()
+        assert _panel_etag(PANEL) == after
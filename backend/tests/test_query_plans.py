@@ -0,0 +1,13 @@
+from app.repo import init_db, use_database
+from app.seed import seed_synthetic
+from app.services import hot_query_plans
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    with use_database(f"sqlite:///{tmp_path / 'plans.db'}"):
+        init_db()
+        seed_synthetic(stations=10, units=200, incidents=500, personnel=600)
+        plans = hot_query_plans()
+    assert plans
+    for plan in plans:
+        assert not plan["full_scan"], plan
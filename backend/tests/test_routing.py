@@ -0,0 +1,47 @@
+import random
+
+from app.routing import INFINITY, Router
+
+
+def test_open_grid_distances_are_manhattan():
+    router = Router(6)
+    width = router.width
+    for source in range(width * width):
+        for target in range(width * width):
+            sx, sy, tx, ty = source % width, source // width, target % width, target // width
+            assert router.distance(sx, sy, tx, ty) == abs(sx - tx) + abs(sy - ty)
+
+
+def test_weight_changes_match_a_full_rebuild():
+    router = Router(12)
+    width = router.width
+    r = random.Random(1)
+    for step in range(1500):
+        for source in r.sample(range(width * width), 20):
+            router.distance(source % width, source // width, 0, 0)
+        router.set_weight(r.randrange(width), r.randrange(width), r.choice([1.0, 1.0, 2.0, 3.5, 0.5, INFINITY]))
+        if step % 25 == 0:
+            fresh = Router(12)
+            fresh.weights = list(router.weights)
+            for source, row in list(router._rows.items()):
+                assert row == fresh._build(source), (step, source)
+    # Both ways of handling a change were exercised.
+    assert router.patched and router.dropped
+
+
+def test_return_distance_matches_routing_from_the_scene():
+    router = Router(12)
+    width = router.width
+    r = random.Random(2)
+    for _ in range(40):
+        router.set_weight(r.randrange(width), r.randrange(width), r.choice([2.0, 3.5, 0.5, INFINITY]))
+    fresh = Router(12)
+    fresh.weights = list(router.weights)
+    homes = r.sample(range(width * width), 6)
+    for home in homes:
+        hx, hy = home % width, home // width
+        for scene in range(width * width):
+            x, y = scene % width, scene // width
+            assert router.return_distance(x, y, hx, hy) == fresh.distance(x, y, hx, hy), (x, y, hx, hy)
+    # Only rows rooted at the homes were built.
+    assert set(router._rows) <= set(homes)
@@ -0,0 +1,18 @@
+from functools import partial
+
+from app.seed import seed_synthetic
+from app.simulation import run_simulation
+
+# A busy world, so a tick that lost its writes would show in the summary.
+SETUP = partial(seed_synthetic, 8, 60, 0, 240, seed=3)
+
+
+def _run(database_url: str) -> dict:
+    summary = run_simulation(hours=3, seed=5, database_url=database_url, setup=SETUP)
+    for key in ("wall_s", "speedup"):
+        summary.pop(key)
+    return summary
+
+
+def test_in_memory_simulation_matches_file_database(tmp_path):
+    assert _run("sqlite://") == _run(f"sqlite:///{tmp_path / 'sim.db'}")
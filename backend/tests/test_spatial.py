@@ -0,0 +1,26 @@
+import random
+
+from app import spatial
+from app.simulation import run_simulation
+from app.spatial import GridIndex, Site
+
+
+def test_nearest_matches_brute_force():
+    r = random.Random(1)
+    sites = [Site(i, r.randrange(60), r.randrange(60)) for i in range(300)]
+    index = GridIndex(sites)
+    points = [(r.randrange(-5, 65), r.randrange(-5, 65)) for _ in range(200)]
+    for (x, y), batch in zip(points, index.nearest_batch(points, 5)):
+        expected = sorted((abs(site.x - x) + abs(site.y - y), site.id) for site in sites)[:5]
+        assert [(distance, site.id) for distance, site in index.nearest(x, y, 5)] == expected
+        assert [(distance, site.id) for distance, site in batch] == expected
+
+
+def test_hospital_index_is_built_once(monkeypatch):
+    loads = []
+    load = spatial._load_hospital_index
+    monkeypatch.setattr(spatial, "_load_hospital_index", lambda: loads.append(1) or load())
+    summary = run_simulation(hours=1, seed=3)
+    # Beds fill and empty as incidents resolve; the positions are loaded once regardless.
+    assert summary["incidents"].get("resolved")
+    assert len(loads) == 1
@@ -0,0 +1,82 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from functools import partial
+
+import pytest
+
+from app import services
+from app.seed import seed_synthetic
+from app.services import BUSY_UNIT_STATUSES, _crew_step_loop, _crew_step_numpy
+from app.simulation import run_simulation
+
+# A small, busy world: within the run units break down and are repaired, and crew tire,
+# rest and come back.
+SETUP = partial(seed_synthetic, 4, 24, 0, 48, seed=3)
+STATE_TABLES = (
+    "gamestate",
+    "hospital",
+    "unit",
+    "personnel",
+    "incident",
+    "dispatch",
+    "incidentarchive",
+    "dispatcharchive",
+    "gameevent",
+)
+
+
+@pytest.mark.skipif(services.np is None, reason="numpy is not installed")
+def test_crew_step_paths_agree():
+    now = datetime(2024, 1, 1, 12)
+    statuses = (None, "available", "maintenance") + BUSY_UNIT_STATUSES
+    rests = (None, now - timedelta(minutes=1), now, now + timedelta(minutes=1))
+    r = random.Random(1)
+    crew = [
+        (
+            i,
+            r.choice((0.0, 9.0, 69.9, 70.0, 94.0, 95.0, 100.0, r.uniform(0, 100))),
+            r.choice(rests),
+            r.random() < 0.5,
+            r.choice(statuses),
+            0,
+        )
+        for i in range(5000)
+    ]
+    draws = [r.random() for _ in crew]
+    assert _crew_step_numpy(crew, draws, now) == _crew_step_loop(crew, draws, now)
+
+
+def _end_state(path, engine: str, vectorized: bool) -> dict:
+    with pytest.MonkeyPatch.context() as patch:
+        if not vectorized:
+            patch.setattr(services, "np", None)
+        run_simulation(
+            hours=3,
+            seed=5,
+            database_url=f"sqlite:///{path}",
+            setup=SETUP,
+            auto_dispatch_every_s=10,
+            engine=engine,
+        )
+    state = {}
+    with sqlite3.connect(path) as conn:
+        for table in STATE_TABLES:
+            # Row versions are bookkeeping for the render cache: both engines raise them on
+            # every change, but not necessarily by the same step.
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] != "version"]
+            state[table] = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id").fetchall()
+    return state
+
+
+@pytest.fixture(scope="module")
+def reference(tmp_path_factory):
+    # The database engine with the per-member crew loop.
+    return _end_state(tmp_path_factory.mktemp("reference") / "world.db", "database", vectorized=False)
+
+
+@pytest.mark.parametrize("engine, vectorized", [("database", True), ("memory", False), ("memory", True)])
+def test_tick_paths_agree(tmp_path, reference, engine, vectorized):
+    if vectorized and services.np is None:
+        pytest.skip("numpy is not installed")
+    assert _end_state(tmp_path / "world.db", engine, vectorized) == reference
@@ -0,0 +1,73 @@
+import contextvars
+import sqlite3
+import threading
+from contextlib import closing
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app import world
+from app.clock import utcnow
+from app.repo import current_tenant, init_db, use_database
+from app.seed import seed
+
+
+def test_memory_tick_keeps_other_writers_out(tmp_path, monkeypatch):
+    # Another process committing between the reload check and the write-back would
+    # have its rows overwritten; while the tick runs it has to wait instead.
+    inside, release = threading.Event(), threading.Event()
+    run_tick = world._run_tick
+
+    def paused(*args):
+        inside.set()
+        release.wait(10)
+        run_tick(*args)
+
+    monkeypatch.setattr(world, "_run_tick", paused)
+    path = tmp_path / "world.db"
+    with use_database(f"sqlite:///{path}"):
+        init_db()
+        seed()
+        ticker = threading.Thread(target=contextvars.copy_context().run, args=(world.memory_world().tick, utcnow()))
+        ticker.start()
+        try:
+            assert inside.wait(10)
+            other = sqlite3.connect(path, timeout=0.1)
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                other.execute("UPDATE gamestate SET funds = funds + 1")
+            other.close()
+        finally:
+            release.set()
+            ticker.join()
+
+
+def test_memory_world_reloads_commits_synced_right_after_its_own(tmp_path):
+    # Another process commits just after a memory tick, and the background version
+    # sync picks that up before the tick has recorded what it wrote.
+    path = tmp_path / "world.db"
+    armed = []
+
+    def foreign_commit(session):
+        if not armed:
+            return
+        armed.clear()
+        with closing(sqlite3.connect(path)) as other, other:
+            other.execute("UPDATE unit SET condition = 0.5 WHERE id = 1")
+            other.execute("UPDATE tableversion SET version = version + 1 WHERE name = 'unit'")
+        current_tenant().sync()
+
+    with use_database(f"sqlite:///{path}"):
+        init_db()
+        seed()
+        memory = world.memory_world()
+        memory.tick(utcnow())
+        event.listen(Session, "after_commit", foreign_commit)
+        try:
+            armed.append(True)
+            memory.tick(utcnow())
+        finally:
+            event.remove(Session, "after_commit", foreign_commit)
+        assert not armed
+        memory.tick(utcnow())
+        assert memory.rows["unit"][1].condition == 0.5